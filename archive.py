@@ -0,0 +1,196 @@
+import os, struct, zipfile, zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Tuple
+
+CHUNK_SIZE = 64 * 1024
+# larger files are compressed chunk by chunk while they are written
+STREAM_SIZE = 4 * 1024 * 1024
+
+
+def write_raw(z: zipfile.ZipFile, info: zipfile.ZipInfo,
+              data: Iterable[bytes]) -> None:
+    ''' write an already compressed entry into an opened zip file.
+
+    `info` must hold the right CRC, compress_size, file_size and
+    compress_type of `data`, the bytes are written as is, no compression.
+    If `data` is a generator which fills them when it's exhausted, such as
+    the chunks of `stream_file`, the header is rewritten after the data.
+
+    Args:
+        z: zip file opened in 'w' or 'a' mode
+        info: entry's zip info
+        data: compressed bytes (or chunks of them)
+    '''
+    if isinstance(data, (bytes, bytearray)):
+        data = [data]
+    zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.external_attr = info.external_attr
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+    # compress_size may not be known yet, like ZipFile.open does
+    zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT or \
+        zinfo.compress_size > zipfile.ZIP64_LIMIT
+
+    # zipfile has no public api to add raw entries, do what ZipFile.write
+    # does without the compressor
+    if z._writing:
+        raise ValueError(
+            "Can't write to ZIP archive while an open writing handle exists")
+    with z._lock:
+        if z._seekable:
+            z.fp.seek(z.start_dir)
+        zinfo.header_offset = z.fp.tell()
+        z._writecheck(zinfo)
+        z._didModify = True
+        z.fp.write(zinfo.FileHeader(zip64))
+        for chunk in data:
+            z.fp.write(chunk)
+        z.start_dir = z.fp.tell()
+        if (zinfo.CRC, zinfo.compress_size, zinfo.file_size) != \
+                (info.CRC, info.compress_size, info.file_size):
+            if not z._seekable:
+                raise ValueError(f'Unknown size of {info.filename}')
+            zinfo.CRC = info.CRC
+            zinfo.compress_size = info.compress_size
+            zinfo.file_size = info.file_size
+            z.fp.seek(zinfo.header_offset)
+            z.fp.write(zinfo.FileHeader(zip64))
+            z.fp.seek(z.start_dir)
+        z.filelist.append(zinfo)
+        z.NameToInfo[zinfo.filename] = zinfo
+
+
+def read_raw(z: zipfile.ZipFile, name: str) -> Iterable[bytes]:
+    ''' iterate the compressed bytes of an entry, without decompression '''
+    info = z.getinfo(name)
+    with z._lock:
+        z.fp.seek(info.header_offset)
+        header = struct.unpack(zipfile.structFileHeader,
+                               z.fp.read(zipfile.sizeFileHeader))
+    offset = info.header_offset + zipfile.sizeFileHeader + \
+        header[zipfile._FH_FILENAME_LENGTH] + \
+        header[zipfile._FH_EXTRA_FIELD_LENGTH]
+    remain = info.compress_size
+    while remain > 0:
+        with z._lock:
+            z.fp.seek(offset)
+            chunk = z.fp.read(min(CHUNK_SIZE, remain))
+        if not chunk:
+            raise zipfile.BadZipFile(f'Truncated entry: {name}')
+        offset += len(chunk)
+        remain -= len(chunk)
+        yield chunk
+
+
+def raw_entry(z: zipfile.ZipFile,
+              name: str) -> Tuple[zipfile.ZipInfo, Iterable[bytes]]:
+    ''' return zip info and compressed bytes of an entry for `write_raw` '''
+    return z.getinfo(name), read_raw(z, name)
+
+
+def deflate_file(filename: str,
+                 arcname: str,
+                 compress_type: int = zipfile.ZIP_DEFLATED,
+                 level: int = None) -> Tuple[zipfile.ZipInfo, bytes]:
+    ''' read and compress a file, return its zip info and compressed bytes,
+    which can be written by `write_raw`.
+
+    zlib releases the GIL, so it can run in threads. Files larger than
+    STREAM_SIZE are not read here, see `stream_file`.
+
+    Args:
+        filename: source file path
+        arcname: path inside the zip file
+        compress_type: zipfile.ZIP_DEFLATED or zipfile.ZIP_STORED
+        level: compression level of zlib, 0~9, default is zlib's default (6)
+    '''
+    info = zipfile.ZipInfo.from_file(filename, arcname)
+    if info.file_size > STREAM_SIZE:
+        return stream_file(filename, arcname, compress_type, level, info)
+    with open(filename, 'rb') as f:
+        data = f.read()
+    info.file_size = len(data)
+    info.CRC = zlib.crc32(data)
+    if compress_type == zipfile.ZIP_DEFLATED:
+        c = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None
+                             else level, zlib.DEFLATED, -15)
+        data = c.compress(data) + c.flush()
+    elif compress_type != zipfile.ZIP_STORED:
+        raise NotImplementedError('only ZIP_DEFLATED and ZIP_STORED')
+    info.compress_type = compress_type
+    info.compress_size = len(data)
+    return info, data
+
+
+def stream_file(filename: str,
+                arcname: str,
+                compress_type: int = zipfile.ZIP_DEFLATED,
+                level: int = None,
+                info: zipfile.ZipInfo = None
+                ) -> Tuple[zipfile.ZipInfo, Iterable[bytes]]:
+    ''' like `deflate_file`, but the file is read and compressed chunk by
+    chunk while `write_raw` writes it, it's never fully in memory.
+    CRC and sizes of the zip info are filled when the chunks are exhausted.
+    '''
+    if compress_type not in (zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED):
+        raise NotImplementedError('only ZIP_DEFLATED and ZIP_STORED')
+    info = info or zipfile.ZipInfo.from_file(filename, arcname)
+    info.compress_type = compress_type
+    info.CRC = 0
+    info.compress_size = 0
+
+    def chunks():
+        c = None
+        if compress_type == zipfile.ZIP_DEFLATED:
+            c = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None
+                                 else level, zlib.DEFLATED, -15)
+        crc = size = compress_size = 0
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                if c is not None:
+                    chunk = c.compress(chunk)
+                compress_size += len(chunk)
+                yield chunk
+        if c is not None:
+            chunk = c.flush()
+            compress_size += len(chunk)
+            yield chunk
+        info.CRC = crc
+        info.file_size = size
+        info.compress_size = compress_size
+
+    return info, chunks()
+
+
+def write_jobs(z: zipfile.ZipFile,
+               jobs: Iterable[Callable[[], Tuple[zipfile.ZipInfo, Iterable[bytes]]]],
+               workers: int = None) -> None:
+    ''' run jobs in a thread pool and write their results into `z`
+    keeping the order of `jobs`.
+
+    Args:
+        z: zip file opened in 'w' mode
+        jobs: callables return (zip info, compressed bytes), such as
+            `partial(deflate_file, filename, arcname)`
+        workers: number of threads, default is the number of cpus,
+            if 1, run jobs one by one in the current thread
+    '''
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for job in jobs:
+            write_raw(z, *job())
+        return
+    # only keep a few finished jobs in memory
+    window = deque()
+    with ThreadPoolExecutor(workers) as pool:
+        for job in jobs:
+            window.append(pool.submit(job))
+            if len(window) >= workers * 4:
+                write_raw(z, *window.popleft().result())
+        while window:
+            write_raw(z, *window.popleft().result())
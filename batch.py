@@ -0,0 +1,167 @@
+''' Build many books in parallel.
+
+A manifest (JSON) lists the books to build:
+
+    {
+        "jobs": [{
+            "name": "mybook",
+            "output": "out",
+            "title": "my book",
+            "authors": ["Roger"],
+            "intro": "epubook is fine",
+            "cover": "cover.jpg",
+            "options": {"level": 6, "split": 307200, "volume_chapters": 1000,
+                        "normalize": true},
+            "chapters": [
+                {"id": 1, "title": "chapter 1", "text": ["para1", "para2"]},
+                {"id": 2, "title": "chapter 2", "html": "<p>para1</p>"},
+                {"id": 3, "title": "chapter 3", "file": "chapter3.xhtml"}
+            ]
+        }]
+    }
+
+Relative paths are relative to the manifest file. Each book is built in its
+own temp dir in a worker process, then `name`.epub (or its volumes) and
+`name`.index.json are moved into `output` (default: the manifest's dir).
+A failed book doesn't stop others. With the `normalize` option, titles and
+plain text are normalized (see `normalize.Normalizer`), lines containing any
+of the regular expressions in the `boilerplate` option are dropped.
+
+Usage:
+    python batch.py manifest.json --workers 4 --summary summary.json
+'''
+import os, sys, json, time, glob, shutil, tempfile, argparse, traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from epub import Epub
+from normalize import Normalizer
+
+
+def build_book(job: dict, base_dir: str = '.') -> dict:
+    ''' build a book of a job in a temp dir, never raise, return the result
+
+    Returns:
+        {name, ok, seconds, outputs, error, stats}
+    '''
+    start = time.perf_counter()
+    name = job.get('name', 'book')
+    result = {'name': name, 'ok': False, 'outputs': [], 'error': None}
+    scratch = tempfile.mkdtemp(prefix='epubook_')
+    try:
+
+        def path(p):
+            return os.path.join(base_dir, p)
+
+        epub = Epub(os.path.join(scratch, name))
+        epub.set_title(job.get('title', name))
+        for author in job.get('authors', []):
+            epub.add_author(author)
+        if 'intro' in job:
+            epub.add_intro(job['intro'])
+        if job.get('cover'):
+            epub.add_cover(path(job['cover']))
+
+        options = job.get('options', {})
+        epub.set_compression(options.get('level'), options.get('workers', 1),
+                             options.get('draft', False))
+        epub.set_split(options.get('split'))
+        epub.set_volumes(options.get('volume_chapters'),
+                         options.get('volume_size'))
+        if options.get('normalize'):
+            epub.set_normalizer(Normalizer(options.get('boilerplate')))
+
+        for c in job.get('chapters', []):
+            if 'file' in c:
+                epub.chapter_from_file(c['id'], c['title'], path(c['file']))
+            elif 'html' in c:
+                epub.create_chapter(c['id'], c['title'], c['html'])
+            else:
+                epub.create_chapter(c['id'], c['title'], c.get('text', ''),
+                                    False)
+        stats = epub.create()
+
+        output = path(job.get('output', '.'))
+        os.makedirs(output, exist_ok=True)
+        for f in sorted(glob.glob(os.path.join(scratch, name + '*'))):
+            dst = os.path.join(output, os.path.basename(f))
+            shutil.move(f, dst)
+            result['outputs'].append(dst)
+        result['stats'] = stats.to_dict()
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+        result['traceback'] = traceback.format_exc()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+        result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def build_books(jobs: List[dict],
+                workers: int = None,
+                base_dir: str = '.') -> dict:
+    ''' build books in a process pool
+
+    Args:
+        jobs: jobs of books, see the manifest format
+        workers: number of processes, default is the number of cpus
+        base_dir: relative paths in jobs are relative to it
+
+    Returns:
+        {succeeded, failed, seconds, results}, results are in the order of jobs
+    '''
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(build_book, job, base_dir) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # the worker process died
+                results.append({
+                    'name': job.get('name', 'book'),
+                    'ok': False,
+                    'outputs': [],
+                    'error': f'{type(e).__name__}: {e}',
+                    'seconds': None
+                })
+    succeeded = sum(1 for r in results if r['ok'])
+    return {
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'seconds': time.perf_counter() - start,
+        'results': results
+    }
+
+
+def build_manifest(manifest: str, workers: int = None) -> dict:
+    ''' build books listed in a manifest file '''
+    with open(manifest, 'r', encoding='utf-8') as f:
+        jobs = json.load(f)['jobs']
+    return build_books(jobs, workers,
+                       os.path.dirname(os.path.abspath(manifest)))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='build books in parallel')
+    parser.add_argument('manifest', help='manifest file (JSON) of books')
+    parser.add_argument('--workers', type=int,
+                        help='number of processes, default: number of cpus')
+    parser.add_argument('--summary', help='save the summary (JSON) to a file')
+    args = parser.parse_args(argv)
+
+    summary = build_manifest(args.manifest, args.workers)
+    for r in summary['results']:
+        status = 'ok' if r['ok'] else f'FAILED {r["error"]}'
+        print(f'{r["name"]}: {status} ({r["seconds"] or 0:.2f}s)')
+    print(f'{summary["succeeded"]} succeeded, {summary["failed"]} failed, '
+          f'{summary["seconds"]:.2f}s')
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+''' Benchmark of creating books.
+
+Synthetic books (CJK text) are created in a temp dir, `Epub.create_chapter`,
+`Epub.create`, `Epub.compression` and `Epub.resume` are timed separately.
+Each case runs in a new process, so its peak RSS is not affected by others.
+Results are printed (or saved) as JSON, compare them between versions to
+find regressions.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --chapters 100 20000 --paragraph short --output bench.json
+'''
+import os, sys, json, time, random, shutil, tempfile, argparse, platform
+import multiprocessing
+from epub import Epub
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# (paragraphs per chapter, characters per paragraph)
+PARAGRAPHS = {
+    'short': (50, 60),
+    'huge': (5, 20000),
+}
+
+DEFAULT_CASES = [(n, 'short') for n in (100, 1000, 5000, 20000)] + \
+    [(n, 'huge') for n in (100, 1000)]
+
+CJK = ''.join(chr(c) for c in range(0x4e00, 0x4e00 + 3000)) + '，。！？“”'
+
+
+def make_chapters(n: int, paragraph: str, seed: int = 0):
+    ''' yield (id, title, paragraphs) of n synthetic chapters '''
+    count, length = PARAGRAPHS[paragraph]
+    rng = random.Random(seed)
+    # a pool of paragraphs, so generating text is cheap
+    pool = [''.join(rng.choices(CJK, k=length)) for _ in range(64)]
+    for i in range(n):
+        paras = [pool[(i * count + j) % len(pool)] for j in range(count)]
+        yield i, f'第{i + 1}章 {pool[i % len(pool)][:8]}', paras
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB on Linux
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def phase(seconds: float, chapters: int, nbytes: int) -> dict:
+    return {
+        'seconds': round(seconds, 4),
+        'chapters_per_s': round(chapters / seconds, 1) if seconds else None,
+        'mb_per_s': round(nbytes / 1e6 / seconds, 2) if seconds else None
+    }
+
+
+def run_case(n: int,
+             paragraph: str,
+             stream: bool = False,
+             level: int = None,
+             workers: int = None) -> dict:
+    ''' create a book of n chapters and time each step '''
+    workdir = tempfile.mkdtemp(prefix='epubook_bench_')
+    path = os.path.join(workdir, 'book')
+    try:
+        epub = Epub(path, stream=stream)
+        epub.set_compression(level, workers)
+        nbytes = 0
+        elapsed = 0
+        for cid, title, paras in make_chapters(n, paragraph):
+            start = time.perf_counter()
+            epub.create_chapter(cid, title, paras, False)
+            elapsed += time.perf_counter() - start
+            nbytes += sum(len(p.encode('utf-8')) for p in paras)
+        phases = {'create_chapter': phase(elapsed, n, nbytes)}
+
+        start = time.perf_counter()
+        epub.create(clean=False)
+        phases['create'] = phase(time.perf_counter() - start, n, nbytes)
+
+        if not stream:
+            start = time.perf_counter()
+            epub.compression(clean=False)
+            phases['compression'] = phase(time.perf_counter() - start, n,
+                                          nbytes)
+
+            start = time.perf_counter()
+            Epub(path, resume=True)
+            phases['resume'] = phase(time.perf_counter() - start, n, nbytes)
+
+            os.remove(epub.index_path)
+            start = time.perf_counter()
+            Epub(path, resume=True)
+            phases['resume_scan'] = phase(time.perf_counter() - start, n,
+                                          nbytes)
+
+        return {
+            'chapters': n,
+            'paragraph': paragraph,
+            'stream': stream,
+            'input_bytes': nbytes,
+            'output_bytes': os.path.getsize(path + '.epub'),
+            'peak_rss_mb': peak_rss_mb(),
+            'phases': phases
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(cases, stream: bool = False, level: int = None,
+        workers: int = None) -> dict:
+    ''' run cases [(chapters, paragraph)], each in a new process '''
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    with ctx.Pool(1, maxtasksperchild=1) as pool:
+        for n, paragraph in cases:
+            results.append(
+                pool.apply(run_case, (n, paragraph, stream, level, workers)))
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='benchmark of epubook')
+    parser.add_argument('--chapters', type=int, nargs='+',
+                        help='numbers of chapters, default: 100 1000 5000 20000')
+    parser.add_argument('--paragraph', nargs='+', choices=list(PARAGRAPHS),
+                        help='paragraph sizes, default: short and huge')
+    parser.add_argument('--stream', action='store_true',
+                        help='create books in stream mode')
+    parser.add_argument('--level', type=int, help='compression level')
+    parser.add_argument('--workers', type=int, help='compression threads')
+    parser.add_argument('--output', help='save the JSON result to a file')
+    args = parser.parse_args(argv)
+
+    if args.chapters is None and args.paragraph is None:
+        cases = DEFAULT_CASES
+    else:
+        cases = [(n, p)
+                 for p in args.paragraph or list(PARAGRAPHS)
+                 for n in args.chapters or (100, 1000, 5000, 20000)]
+    result = run(cases, args.stream, args.level, args.workers)
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import time, sqlite3, threading
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class HttpCache():
+    ''' on-disk cache of responses, keyed by url.
+
+    It keeps the body, encoding, ETag and Last-Modified of each response,
+    so a `Fetcher` can revalidate it with a conditional GET. When the
+    total size of bodies exceeds `max_size`, the least recently used
+    entries are removed.
+
+    Usage:
+        cache = HttpCache('.epubook_cache')
+        with Fetcher(cache=cache) as fetcher:
+            ...
+        print(cache.hits, cache.misses)
+        cache.close()
+    '''
+
+    def __init__(self,
+                 path: str = '.epubook_cache',
+                 max_size: int = 512 * 1024 * 1024,
+                 max_age: float = None) -> None:
+        '''
+        Args:
+            path: the cache file
+            max_size: max total size of cached bodies in bytes
+            max_age: if an entry is younger than max_age seconds, it's used
+                without asking the server, default None, always revalidate.
+                Useful for sites without ETag and Last-Modified
+        '''
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                        'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+                        'content_type TEXT, encoding TEXT, body BLOB, '
+                        'size INTEGER, fetched REAL, used REAL)')
+        self.db.execute(
+            'CREATE INDEX IF NOT EXISTS entries_used ON entries (used)')
+        self.db.commit()
+        self.size = self.db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self),
+            'size': self.size
+        }
+
+    def headers(self, url: str) -> dict:
+        ''' headers for a conditional GET of `url`, empty if not cached '''
+        with self.lock:
+            row = self.db.execute(
+                'SELECT etag, last_modified FROM entries WHERE url = ?',
+                (url, )).fetchone()
+        headers = {}
+        if row is not None:
+            if row[0]:
+                headers['If-None-Match'] = row[0]
+            if row[1]:
+                headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def fresh(self, url: str) -> bool:
+        ''' if `url` is cached and younger than `max_age` '''
+        if self.max_age is None:
+            return False
+        with self.lock:
+            row = self.db.execute(
+                'SELECT fetched FROM entries WHERE url = ?',
+                (url, )).fetchone()
+        return row is not None and time.time() - row[0] < self.max_age
+
+    def get(self, url: str) -> requests.Response:
+        ''' the cached response of `url`, None if not cached, count a hit '''
+        with self.lock:
+            row = self.db.execute(
+                'SELECT etag, last_modified, content_type, encoding, body '
+                'FROM entries WHERE url = ?', (url, )).fetchone()
+            if row is None:
+                return None
+            self.db.execute('UPDATE entries SET used = ? WHERE url = ?',
+                            (time.time(), url))
+            self.hits += 1
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict()
+        for k, v in zip(('ETag', 'Last-Modified', 'Content-Type'), row[:3]):
+            if v:
+                response.headers[k] = v
+        response.encoding = row[3]
+        response._content = row[4]
+        return response
+
+    def put(self, url: str, response: requests.Response) -> None:
+        ''' save a response, count a miss '''
+        body = response.content
+        now = time.time()
+        with self.lock:
+            self.misses += 1
+            old = self.db.execute('SELECT size FROM entries WHERE url = ?',
+                                  (url, )).fetchone()
+            if old is not None:
+                self.size -= old[0]
+            self.db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, response.headers.get('ETag'),
+                 response.headers.get('Last-Modified'),
+                 response.headers.get('Content-Type'), response.encoding,
+                 body, len(body), now, now))
+            self.size += len(body)
+            self.evict()
+            self.db.commit()
+
+    def evict(self) -> None:
+        ''' remove least recently used entries until size <= max_size '''
+        while self.size > self.max_size:
+            row = self.db.execute(
+                'SELECT url, size FROM entries ORDER BY used LIMIT 1').fetchone()
+            if row is None:
+                break
+            self.db.execute('DELETE FROM entries WHERE url = ?', (row[0], ))
+            self.size -= row[1]
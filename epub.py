@@ -1,41 +1,288 @@
-import os, glob, re
+import os, io, glob, re, json, time, hashlib, threading
+from functools import partial
 import shutil, zipfile
-from typing import List
-from utils import EpubBase
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Tuple
+import templates, fonts
+from utils import EpubBase, SOURCES_LOG, media_type
+from archive import raw_entry, deflate_file, write_jobs
+from stats import BuildStats, PhaseStats
+from reader import EpubReader
+from search import IndexBuilder, plain_text
+from registry import ChapterRegistry, normalize_cid
+
+if TYPE_CHECKING:  # normalize imports epub
+    from normalize import Normalizer
 
 
 class Epub(EpubBase):
 
-    def __init__(self, path: str, resume=False):
-        super(Epub, self).__init__(path)
-        self.catalog = {}  # {id:title}
+    def __init__(self, path: str, resume=False, stream: bool = False):
+        ''' 
+        Args:
+            path: the file name to save without suffix
+            resume: if True, resume chapters from an existed dir
+            stream: if True, write everything straight into `path`.epub
+                without a temp dir, each chapter must be created only once
+        '''
+        if resume and stream:
+            raise ValueError('resume is not supported in stream mode')
+        super(Epub, self).__init__(path, stream)
+        self.catalog = ChapterRegistry()  # {id:title}, sorted
+        self.lock = threading.RLock()  # for chapters written by threads
+        self.stream_lock = threading.Lock()  # one chapter at a time in stream mode
+        self.chapter_info = {}  # {id:(size, sha1)}
+        self.parts = {}  # {id:number of parts}, only split chapters
+        self.sections = {}  # {id of the first chapter:section title}
+        self.updated = set()  # ids changed since the last build
+        self.index_path = self.path + '.index.json'
+        self.outputs = None  # names of epub files of the last build
+        self.compress_level = None
+        self.compress_workers = None
+        self.max_chapter_size = None
+        self.volume_chapters = None
+        self.volume_size = None
+        self.normalizer = None
+        self.search = None
+        self.catalog_page_size = None
+        self.nav = False
+        self.font = None  # source font file
+        self.font_flavor = None
+        self.font_data = None  # the subset font
+        self.charset = set()  # characters used by the book, for the font
+        self.charset_chapters = set()  # ids of chapters in the charset
+        self.hooks = {}
+        self.stats = BuildStats(self.hooks)
         if resume:
             self.resume()
 
+    @staticmethod
+    def open(filename: str) -> EpubReader:
+        ''' open an existing epub file for reading, chapters are read on
+        demand without extracting the file, see `EpubReader`
+        '''
+        return EpubReader(filename)
+
     def resume(self) -> None:
         """ 
         resume from an existed dir, obtain chapters' id and title,
         fill self.catalog
+
+        If the index file (`path`.index.json) of the last build exists,
+        it is loaded, and only chapters written after it (not in the index,
+        or modified later) are read from the dir. Without the index,
+        chapters are sorted by id.
+        Chapters and resources of source files (see `chapter_from_file`,
+        `add_cover`) are restored from the index and SOURCES_LOG.
         """
-        l = glob.glob(os.path.join(self.path, 'chapter_*.xhtml'))
-        l = sorted(l, key=lambda x: int(x.split('_')[-1].split('.')[0]))
-        for f in l:
-            cid = int(f.split('_')[-1].split('.')[0])
-            with open(f, 'r') as _f:
-                title = re.findall('<title>(.*?)</title>', _f.read())[0]
-            self.catalog[cid] = title
+        since = None
+        if os.path.exists(self.index_path):
+            self.load_index()
+            since = os.stat(self.index_path).st_mtime_ns
+        titles = {}  # {id:title} of chapters from source files
+        for entry in self.read_sources_log().values():
+            name = entry['name']
+            if entry['path'] is None:
+                # a chapter written by a writer, or a replaced resource
+                self.sources.pop(name, None)
+                for sha1 in [
+                        h for h, r in self.resources.items() if r[0] == name
+                ]:
+                    del self.resources[sha1]
+                continue
+            self.sources[name] = entry['path']
+            if 'hash' in entry:
+                self.restore_resource(entry['hash'], name, entry['id'],
+                                      entry['media_type'])
+                continue
+            cid = normalize_cid(entry['cid'])
+            self.parts.pop(cid, None)
+            if since is None:
+                titles[cid] = entry['title']
+            else:
+                self.catalog.add(cid, entry['title'], entry['order'])
+            self.stat_source(cid, since is not None)
+        files = {}  # {id:{part:file}}
+        newer = set()  # ids of chapters written after the index
+        for entry in os.scandir(self.path):
+            m = re.match(r'chapter_(.+?)(?:-(\d+))?\.xhtml$', entry.name)
+            if m is None:
+                continue
+            cid = normalize_cid(m.group(1))
+            files.setdefault(cid, {})[int(m.group(2) or 0)] = entry.path
+            if since is not None and cid not in newer and \
+                    entry.stat().st_mtime_ns > since:
+                newer.add(cid)
+        # ids are ints or strings, see `normalize_cid`
+        for cid in sorted(files.keys(), key=lambda c: (isinstance(c, str), c)):
+            if 0 not in files[cid] or f'chapter_{cid}.xhtml' in self.sources:
+                continue
+            if since is not None and cid in self.catalog and cid not in newer:
+                continue
+            size = 0
+            sha1 = hashlib.sha1()
+            for part in sorted(files[cid].keys()):
+                with open(files[cid][part], 'rb') as _f:
+                    content = _f.read()
+                size += len(content)
+                sha1.update(content)
+                if part == 0:
+                    title = re.findall('<title>(.*?)</title>',
+                                       content.decode('utf-8'))[0]
+            if since is None:
+                titles[cid] = title
+                self.chapter_info[cid] = (size, sha1.hexdigest())
+            else:
+                self.catalog[cid] = title
+                self.record_chapter(cid, size, sha1.hexdigest())
+            if len(files[cid]) > 1:
+                self.parts[cid] = len(files[cid])
+            else:
+                self.parts.pop(cid, None)
+        for cid in sorted(titles, key=lambda c: (isinstance(c, str), c)):
+            self.catalog[cid] = titles[cid]
+
+    def read_sources_log(self) -> Dict[str, dict]:
+        ''' the last line of each name in SOURCES_LOG '''
+        entries = {}
+        filename = os.path.join(self.path, SOURCES_LOG)
+        if os.path.exists(filename):
+            with open(filename, 'r', encoding='utf-8') as f:
+                for line in f:
+                    # the last line may be cut if the process was killed
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries[entry['name']] = entry
+        return entries
+
+    def stat_source(self, cid, record: bool = True) -> None:
+        ''' take size and modification time of a chapter's source file as
+        its size and hash, a missing file is reported by `create`
+
+        Args:
+            cid: chapter id
+            record: if True, mark the chapter as updated if they changed
+        '''
+        try:
+            stat = os.stat(self.sources[f'chapter_{cid}.xhtml'])
+        except FileNotFoundError:
+            return
+        if record:
+            self.record_chapter(cid, stat.st_size, f'mtime:{stat.st_mtime_ns}')
+        else:
+            self.chapter_info[cid] = (stat.st_size, f'mtime:{stat.st_mtime_ns}')
+
+    def load_index(self) -> None:
+        ''' load chapters' id, title, size and hash, resources and source
+        files from the index file. Source files are checked by a stat call,
+        chapters of changed files are marked as updated
+        '''
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        for c in index['chapters']:
+            cid = normalize_cid(c['cid'])
+            self.catalog.add(cid, c['title'], c.get('order'))
+            self.chapter_info[cid] = (c['size'], c['hash'])
+            if c.get('parts', 1) > 1:
+                self.parts[cid] = c['parts']
+        for s in index.get('sections', []):
+            self.sections[normalize_cid(s['cid'])] = s['title']
+        self.outputs = index.get('outputs')
+        for r in index.get('resources', []):
+            self.restore_resource(r['hash'], r['href'], r['id'],
+                                  r['media_type'])
+        for s in index.get('sources', []):
+            self.sources[s['name']] = s['path']
+            m = re.match(r'chapter_(.+)\.xhtml$', s['name'])
+            if m is not None:
+                self.stat_source(normalize_cid(m.group(1)))
+
+    def write_index(self) -> None:
+        ''' write chapters' id, title, size and hash, resources, source files
+        and epub files of this build into the index file, it is kept after
+        cleaning the temp dir
+        '''
+        chapters = []
+        for cid, title in self.catalog.items():
+            size, sha1 = self.chapter_info.get(cid, (None, None))
+            chapters.append({
+                'cid': cid,
+                'order': self.catalog.order(cid),
+                'title': title,
+                'size': size,
+                'hash': sha1,
+                'parts': self.parts.get(cid, 1)
+            })
+        sections = [{
+            'cid': cid,
+            'title': title
+        } for cid, title in self.sections.items()]
+        resources = [{
+            'hash': sha1,
+            'href': href,
+            'id': rid,
+            'media_type': mtype
+        } for sha1, (href, rid, mtype) in self.resources.items()]
+        sources = []
+        for name, path in self.sources.items():
+            try:
+                stat = os.stat(path)
+                size, mtime = stat.st_size, stat.st_mtime_ns
+            except FileNotFoundError:
+                # removed after it's packed, see `compress_files`
+                size = mtime = None
+            sources.append({
+                'name': name,
+                'path': path,
+                'size': size,
+                'mtime': mtime
+            })
+        with self.stats.phase('index') as stats:
+            with open(self.index_path, 'w', encoding='utf-8') as f:
+                json.dump(
+                    {
+                        'version': 1,
+                        'chapters': chapters,
+                        'sections': sections,
+                        'resources': resources,
+                        'sources': sources,
+                        'outputs': self.outputs
+                    },
+                    f,
+                    ensure_ascii=False)
+            stats.bytes += os.path.getsize(self.index_path)
+            stats.files += 1
+
+    def record_chapter(self, cid: int, size: int, sha1: str) -> None:
+        ''' update size and hash of a chapter, mark it as updated if it
+        differs from the last build
+        '''
+        info = (size, sha1)
+        if self.chapter_info.get(cid) != info:
+            self.updated.add(cid)
+        self.chapter_info[cid] = info
+
+    def chapter_files(self, cid: int) -> List[str]:
+        ''' files of a chapter, a split chapter has more than one file '''
+        files = [f'chapter_{cid}.xhtml']
+        for k in range(1, self.parts.get(cid, 1)):
+            files.append(f'chapter_{cid}-{k}.xhtml')
+        return files
 
     def create_chapter(self,
                        cid: int,
                        title: str,
-                       text: str or List[str],
+                       text: str or Iterable[str],
                        html: bool = True,
-                       full: bool = False) -> None:
+                       full: bool = False,
+                       order: float = None) -> None:
         ''' create a chapter from text.
         
         The text can be \n
         (1) normal content text, i.e. a full chapter in string, set html=False;\n 
-        (2) a string list, each element is a paragraph of a chapter;\n
+        (2) a string list (or any iterable, such as a generator), each element 
+        is a paragraph of a chapter, paragraphs are written one by one;\n
         (3) xhtml text, it can be text from a completed XHTML file (set html=True, full=True),
         or text without XHTML head, meta, just keep body, such as 
         "<p>para1</p><p>para2<\p>" (html=True, full=False, default settings)
@@ -46,127 +293,728 @@ class Epub(EpubBase):
             text: content
             html: if True, text in html format, default is True
             full: if True, text can be created a full XHTML file
+            order: sort key of the chapter in spine, toc and catalog, see
+                `chapter_writer`
         '''
-        self.catalog[cid] = title
-        chapter = EpubChapter(title)
-
-        if isinstance(text, list) or not html:
-            content = chapter.from_text(text)
+        if self.normalizer is not None:
+            title = self.normalizer.title(title)
+        if isinstance(text, str) and html:
+            with self.chapter_writer(cid, title, full, order) as w:
+                if full or self.max_chapter_size is None:
+                    w.write(text)
+                else:
+                    for block in EpubChapter.blocks(text):
+                        w.write_block(block)
         else:
-            content = chapter.from_html_text(text, full)
+            if self.normalizer is not None and not html:
+                paragraphs = self.normalizer.paragraphs(text)
+            else:
+                paragraphs = EpubChapter.paragraphs(text)
+            with self.chapter_writer(cid, title, order=order) as w:
+                for p in paragraphs:
+                    w.write_paragraph(p)
 
-        with open(os.path.join(self.path, f'chapter_{cid}.xhtml'),
-                  'w',
-                  encoding='utf-8') as f:
-            f.write(content)
+    def chapter_writer(self,
+                       cid: int,
+                       title: str,
+                       full: bool = False,
+                       order: float = None) -> 'ChapterWriter':
+        ''' create a chapter by writing it piece by piece, the chapter is
+        not kept in memory.
 
-    def chapter_from_file(self, cid: str, title: str, filename: str) -> None:
-        ''' create a chapter from a XHTML file
+        Chapters can be written from many threads at the same time (one
+        thread for each chapter), they are sorted by `order` at `create`,
+        not by the time they are written. In stream mode, writers wait for
+        each other.
+
+        Usage:
+            with epub.chapter_writer(cid, title) as w:
+                for p in paragraphs:
+                    w.write_paragraph(p)
+
+        Args:
+            cid: chapter id in opf file, ncx file
+            title: chapter name
+            full: if True, XHTML head and tail are not written, the writer
+                must write a full XHTML file
+            order: sort key (a number) of the chapter, default is the order
+                of adding for a new chapter, see `ChapterRegistry`
+        '''
+        return ChapterWriter(self, cid, title, full, order)
+
+    def chapter_from_file(self,
+                          cid: str,
+                          title: str,
+                          filename: str,
+                          order: float = None) -> None:
+        ''' create a chapter from a XHTML file. The file is not copied or
+        read here (unless the search index is built), it's read into the
+        epub file by `create`, so it must not be removed before that.
+        Its size and modification time are recorded to find changed
+        chapters in incremental builds.
 
         Args:
             cid: chapter id in opf file, ncx file
             title: chapter name
             filename: XHTML file path
+            order: sort key of the chapter, see `chapter_writer`
+        '''
+        if not os.path.isfile(filename):
+            raise FileNotFoundError(f'File: {filename} not exists!')
+        cid = normalize_cid(cid)
+        start = time.perf_counter()
+        stat = os.stat(filename)
+        if self.stream:
+            with self.stream_lock:
+                self.add_file(filename, f'chapter_{cid}.xhtml')
+        with self.lock:
+            self.catalog.add(cid, title, order)
+            self.parts.pop(cid, None)
+            if not self.stream:
+                self.add_file(filename, f'chapter_{cid}.xhtml')
+                self.log_source(f'chapter_{cid}.xhtml',
+                                cid=cid,
+                                title=title,
+                                order=self.catalog.order(cid))
+        if self.search is not None or self.font is not None:
+            with open(filename, 'r', encoding='utf-8') as f:
+                text = f.read()
+            if self.search is not None:
+                self.search.start(cid)
+                self.search.add_html(cid, text)
+            if self.font is not None:
+                self.charset.update(plain_text(text))
+                self.charset_chapters.add(cid)
+        size = stat.st_size
+        with self.lock:
+            self.record_chapter(cid, size, f'mtime:{stat.st_mtime_ns}')
+            self.stats.add_chapter(cid, title, size, 1,
+                                   time.perf_counter() - start)
+
+    def set_compression(self,
+                        level: int = None,
+                        workers: int = None,
+                        draft: bool = False,
+                        policy: Dict[str, int] = None) -> None:
+        ''' set how to compress the epub file
+
+        Args:
+            level: compression level, 0~9, default is zlib's default (6)
+            workers: number of threads to compress chapters,
+                default is the number of cpus, 1 for no threads
+            draft: if True, store all files without compression,
+                it's fast but the epub file is large
+            policy: {media type: zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED},
+                update the default policy, which stores jpeg, png, gif, webp
+                and woff fonts, and deflates others
+        '''
+        if policy is not None:
+            for mtype, compress_type in policy.items():
+                if compress_type not in (zipfile.ZIP_STORED,
+                                         zipfile.ZIP_DEFLATED):
+                    raise ValueError(
+                        f'Unsupported compress type of {mtype}: '
+                        f'{compress_type}, only ZIP_STORED and ZIP_DEFLATED')
+        self.compress_level = level
+        self.compress_workers = workers
+        self.draft = draft
+        if policy is not None:
+            self.compress_policy.update(policy)
+        if self.stream:
+            self.zip.compression = zipfile.ZIP_STORED if draft else zipfile.ZIP_DEFLATED
+            self.zip.compresslevel = level
+
+    def set_hooks(self,
+                  on_phase_start: Callable[[str], None] = None,
+                  on_phase_end: Callable[[str, PhaseStats], None] = None,
+                  on_chapter_written: Callable = None) -> None:
+        ''' set callbacks of build events, such as for metrics or profiling
+
+        Args:
+            on_phase_start: called with the phase name (metadata,
+                compression, index) when a phase starts
+            on_phase_end: called with the phase name and its PhaseStats
+                when a phase ends
+            on_chapter_written: called with (id, title, size, seconds) when
+                a chapter is written
+        '''
+        self.hooks['on_phase_start'] = on_phase_start
+        self.hooks['on_phase_end'] = on_phase_end
+        self.hooks['on_chapter_written'] = on_chapter_written
+
+    def set_normalizer(self, normalizer: 'Normalizer' = None) -> None:
+        ''' normalize titles and plain text (html=False) of `create_chapter`,
+        such as escaping & and <, collapsing whitespace and dropping empty
+        lines, see `normalize.Normalizer`
+
+        Args:
+            normalizer: a Normalizer, None for writing text as is
+        '''
+        self.normalizer = normalizer
+
+    def add_section(self, cid: int, title: str) -> None:
+        ''' start a section, such as a volume of a novel, from a chapter.
+        Chapters until the next section are grouped under it in toc.ncx,
+        catalog and nav.xhtml
+
+        Args:
+            cid: id of the first chapter of the section
+            title: section name
+        '''
+        self.sections[normalize_cid(cid)] = title
+
+    def set_catalog(self, page_size: int = None, nav: bool = False) -> None:
+        ''' set how to write the catalog
+
+        Args:
+            page_size: max number of chapters of each catalog page,
+                catalog.xhtml, catalog_1.xhtml ... are linked one by one.
+                None for a single page
+            nav: if True, write an EPUB 3 navigation document nav.xhtml,
+                the book becomes EPUB 3 (toc.ncx is kept for old readers)
+        '''
+        self.catalog_page_size = page_size
+        self.nav = nav
+
+    def catalog_files(self) -> List[str]:
+        ''' files of catalog pages '''
+        pages = 1
+        if self.catalog_page_size and self.catalog:
+            pages = (len(self.catalog) - 1) // self.catalog_page_size + 1
+        return ['catalog.xhtml'] + [f'catalog_{k}.xhtml' for k in range(1, pages)]
+
+    def set_search(self, enabled: bool = True) -> None:
+        ''' build a full-text search index of chapters while they are written,
+        it's saved as search.json in the book, see `search.SearchIndex`
+
+        Args:
+            enabled: if False, no index is built
+        '''
+        self.search = IndexBuilder() if enabled else None
+
+    def set_font(self,
+                 filename: str = None,
+                 family: str = 'epubook',
+                 flavor: str = None) -> None:
+        ''' embed a font (such as a CJK font) and use it for all text. It's
+        subset to the characters used in the book when the book is created,
+        so it only adds a few hundred KB. Requires fontTools.
+        Call it before creating chapters, so their characters are collected
+        while they are written, otherwise chapters are read again.
+
+        Args:
+            filename: ttf or otf font file, None for no font
+            family: font family name in the stylesheet
+            flavor: None to keep the font format, 'woff' or 'woff2'
+                (requires brotli) for smaller files
+        '''
+        if filename is None:
+            self.font = self.font_href = self.font_family = None
+            return
+        fonts.require()
+        if not os.path.isfile(filename):
+            raise FileNotFoundError(f'Font: {filename} not exists!')
+        if flavor not in fonts.FLAVORS:
+            raise ValueError(f'Unsupported font flavor: {flavor}')
+        self.font = filename
+        self.font_flavor = flavor
+        self.font_family = family
+        self.font_href = f'fonts/font.{fonts.font_suffix(filename, flavor)}'
+
+    def set_split(self, max_chapter_size: int = None) -> None:
+        ''' split large chapters into several XHTML files at paragraph
+        boundaries, all parts share one item in catalog and toc.
+        Chapters from `chapter_from_file` and full XHTML text are not split.
+
+        Args:
+            max_chapter_size: max size of each file in bytes, None for no split
         '''
-        if not os.path.exists(filename):
-            print(f'File: {filename} not exists!')
-            exit(1)
-        self.catalog[cid] = title
-        shutil.copy(filename, os.path.join(self.path, f'chapter_{cid}.xhtml'))
+        self.max_chapter_size = max_chapter_size
+
+    def set_volumes(self,
+                    max_chapters: int = None,
+                    max_size: int = None) -> None:
+        ''' split the book into volumes, `path`_1.epub, `path`_2.epub ...,
+        each volume has its own content.opf, toc.ncx and catalog.xhtml.
+        Not supported in stream mode.
 
-    def create(self, clean: bool = True) -> None:
+        Args:
+            max_chapters: max number of chapters of each volume
+            max_size: max size of chapters (uncompressed) of each volume in bytes
+        '''
+        if self.stream and (max_chapters or max_size):
+            raise ValueError('volumes are not supported in stream mode')
+        self.volume_chapters = max_chapters
+        self.volume_size = max_size
+
+    def volumes(self) -> List[List[int]]:
+        ''' chapter ids of each volume '''
+        volumes = [[]]
+        size = 0
+        for cid in self.catalog.keys():
+            csize = self.chapter_info.get(cid, (0, None))[0] or 0
+            if volumes[-1] and (
+                    self.volume_chapters and len(volumes[-1]) >= self.volume_chapters
+                    or self.volume_size and size + csize > self.volume_size):
+                volumes.append([])
+                size = 0
+            volumes[-1].append(cid)
+            size += csize
+        return volumes
+
+    def create(self, clean: bool = True, incremental: bool = False) -> BuildStats:
         ''' create a epub file
 
         Args:
-            clean: if True, delete temp file (unzip epub file can obtain it), default True
+            clean: if True, delete temp file (unzip epub file can obtain it), default True.
+                Not used in stream mode, there is no temp file
+            incremental: if True, update the existed `path`.epub, unchanged chapters
+                are copied from it without recompression, see `compression`
+
+        Returns:
+            time, bytes and files of each phase (chapters, metadata, compression,
+            index) of this build
         '''
-        self.write_META_INF()
-        self.write_opf()
-        self.write_page()
-        self.write_catalog()
-        self.write_mimetype()
-        self.write_stylesheet()
-        self.write_toc()
-        self.compression(clean)
+        if incremental and self.stream:
+            raise ValueError('incremental is not supported in stream mode')
+        if self.search is not None:
+            self.load_search()
+        if self.font is not None:
+            self.subset_font()
+        previous = self.output_files()
+        volumes = self.volumes()
+        if len(volumes) > 1:
+            self.create_volumes(volumes, clean, incremental)
+            outputs = [f'{self.path}_{k}.epub' for k in range(1, len(volumes) + 1)]
+        else:
+            self.write_metadata()
+            if self.stream:
+                with self.stats.phase('compression') as stats:
+                    self.zip.close()
+                    stats.bytes += os.path.getsize(self.path + '.epub')
+                    stats.files += len(self.zip.infolist())
+            else:
+                self.compression(clean, incremental)
+            outputs = [self.path + '.epub']
+        # files of the last build which are not written again, such as
+        # `path`.epub after the book is split into volumes
+        written = set(os.path.abspath(f) for f in outputs)
+        for f in previous:
+            if os.path.abspath(f) not in written and os.path.exists(f):
+                os.remove(f)
+        self.outputs = [os.path.basename(f) for f in outputs]
+        self.write_index()
+        stats = self.stats
+        self.stats = BuildStats(self.hooks)
+        return stats
 
-    def compression(self, clean: bool = True) -> None:
-        file_list = os.listdir(self.path)
-        z = zipfile.ZipFile(self.path + '.epub', 'w', zipfile.ZIP_DEFLATED)
-        z.write(os.path.join(self.path, 'mimetype'),
-                'mimetype',
-                compress_type=zipfile.ZIP_STORED)
-        file_list.remove('mimetype')
-        for f in file_list:
-            if not os.path.isdir(os.path.join(self.path, f)):
-                z.write(os.path.join(self.path, f), f)
+    def write_metadata(self) -> None:
+        ''' write all files except chapters and resources '''
+        with self.stats.phase('metadata') as stats:
+            self.write_META_INF()
+            names = self.write_navigation()
+            self.write_page()
+            self.write_mimetype()
+            self.write_stylesheet()
+            names += ['META-INF/container.xml', 'page.xhtml', 'stylesheet.css']
+            if self.search is not None:
+                self.write_search()
+                names.append('search.json')
+            if self.font is not None:
+                self.write_font()
+                names.append(self.font_href)
+            if not self.stream:
+                names.append('mimetype')
+            stats.bytes += sum(self.file_size(name) for name in names)
+            stats.files += len(names)
+
+    def output_files(self) -> List[str]:
+        ''' epub files of the last build, `path`.epub or its volumes, as
+        recorded in the index file. Without the record, any of them
+        '''
+        outputs = self.outputs
+        if outputs is None and os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                outputs = json.load(f).get('outputs')
+        if outputs is not None:
+            folder = os.path.dirname(self.path)
+            return [os.path.join(folder, f) for f in outputs]
+        books = glob.glob(glob.escape(self.path) + '_*.epub')
+        return [self.path + '.epub'] + sorted(
+            b for b in books if re.search(r'_\d+\.epub$', b))
+
+    def old_books(self) -> List[zipfile.ZipFile]:
+        ''' open epub files of the last build, see `output_files` '''
+        return [
+            zipfile.ZipFile(b) for b in self.output_files() if os.path.exists(b)
+        ]
+
+    def chapter_texts(self, cid: int,
+                      books: List[zipfile.ZipFile]) -> Iterable[str]:
+        ''' yield XHTML of each file of a chapter, read from the temp dir,
+        its source file, or `books` of the last build
+        '''
+        for f in self.chapter_files(cid):
+            filename = self.sources.get(f, os.path.join(self.path, f))
+            if os.path.exists(filename):
+                with open(filename, 'rb') as _f:
+                    content = _f.read()
             else:
-                fs = os.listdir(os.path.join(self.path, f))
-                z.write(os.path.join(self.path, f, fs[0]),
-                        os.path.join(f, fs[0]))
+                z = next((z for z in books if f in z.NameToInfo), None)
+                if z is None:
+                    return
+                content = z.read(f)
+            yield content.decode('utf-8')
+
+    def load_search(self) -> None:
+        ''' index chapters which are not written since the Epub is created,
+        i.e. resumed chapters. They are taken from search.json of the last
+        build, or indexed from their files
+        '''
+        missing = [cid for cid in self.catalog if cid not in self.search.chapters]
+        if not missing or self.stream:
+            return
+        books = self.old_books()
+        try:
+            for z in books:
+                if 'search.json' in z.NameToInfo:
+                    missing = [
+                        cid for cid in missing if cid not in self.search.chapters
+                    ]
+                    self.search.load(json.loads(z.read('search.json')), missing)
+            for cid in missing:
+                if cid in self.search.chapters:
+                    continue
+                self.search.start(cid)
+                offset = 0
+                for text in self.chapter_texts(cid, books):
+                    offset += self.search.add_html(cid, text, offset)
+        finally:
+            for z in books:
+                z.close()
+
+    def load_charset(self) -> None:
+        ''' add characters of chapters which are not written since the Epub
+        is created (i.e. resumed chapters), titles and catalog into the
+        charset of the embedded font
+        '''
+        missing = [cid for cid in self.catalog if cid not in self.charset_chapters]
+        if missing and not self.stream:
+            books = self.old_books()
+            try:
+                for cid in missing:
+                    for text in self.chapter_texts(cid, books):
+                        self.charset.update(plain_text(text))
+                    self.charset_chapters.add(cid)
+            finally:
+                for z in books:
+                    z.close()
+        for title in self.catalog.values():
+            self.charset.update(plain_text(title))
+        for title in self.sections.values():
+            self.charset.update(plain_text(title))
+        self.charset.update(
+            plain_text(templates.CATALOG_HEAD + templates.NAV_HEAD) + '上一页下一页')
+
+    def subset_font(self) -> None:
+        ''' subset the font to the charset of all chapters '''
+        with self.stats.phase('font') as stats:
+            self.load_charset()
+            self.font_data = fonts.subset_font(self.font, self.charset,
+                                               self.font_flavor)
+            stats.bytes += len(self.font_data)
+            stats.files += 1
+
+    def write_font(self) -> None:
+        ''' write the subset font, see `subset_font` '''
+        if not self.stream:
+            os.makedirs(os.path.join(self.path, 'fonts'), exist_ok=True)
+        with self.open_file(self.font_href, 'wb') as f:
+            f.write(self.font_data)
+
+    def write_search(self) -> None:
+        ''' write search.json of chapters in self.catalog '''
+        # json.dumps is much faster than json.dump for a large index
+        content = json.dumps(self.search.to_dict(self.catalog.keys()),
+                             ensure_ascii=False,
+                             separators=(',', ':'))
+        with self.open_file('search.json') as f:
+            f.write(content)
+
+    def create_volumes(self,
+                       volumes: List[List[int]],
+                       clean: bool = True,
+                       incremental: bool = False) -> None:
+        ''' create `path`_1.epub, `path`_2.epub ... one for each volume '''
+        catalog, title, sections = self.catalog, self.title, self.sections
+        # the section of the first chapter of each volume
+        starts = {cids[0]: k for k, cids in enumerate(volumes, 1)}
+        heads = {}
+        current = None
+        for cid in catalog:
+            current = sections.get(cid, current)
+            if cid in starts and current is not None:
+                heads[starts[cid]] = current
+        # chapters of a volume may be in any volume of the last build, all
+        # volumes are written into .tmp files and replaced at the end
+        books = self.old_books() if incremental else []
+        written = []
+        try:
+            for k, cids in enumerate(volumes, 1):
+                self.catalog = {cid: catalog[cid] for cid in cids}
+                self.sections = {
+                    cid: sections[cid]
+                    for cid in cids if cid in sections
+                }
+                if k in heads and cids[0] not in self.sections:
+                    self.sections[cids[0]] = heads[k]
+                self.title = f'{title} ({k}/{len(volumes)})'
+                self.write_metadata()
+                epub_path = f'{self.path}_{k}.epub'
+                written.append((self.compression(False, incremental, epub_path,
+                                                 books), epub_path))
+        finally:
+            self.catalog, self.title, self.sections = catalog, title, sections
+            for z in books:
+                z.close()
+        for out_path, epub_path in written:
+            if out_path != epub_path:
+                os.replace(out_path, epub_path)
+        self.updated.clear()
         if clean:
             shutil.rmtree(self.path)
 
-    def write_opf(self) -> None:
-        ''' write content.opf file'''
-        self.write_opf_head()
-        cont1 = '    <item href=\"catalog.xhtml\" id=\"catalog\" media-type=\"application/xhtml+xml\"/>\n' + \
-            '    <item href=\"stylesheet.css\" id=\"css\" media-type=\"text/css\"/>\n' + \
-            '    <item href=\"page.xhtml\" id=\"page\" media-type=\"application/xhtml+xml\"/>\n' + \
-            '    <item href=\"toc.ncx\" media-type=\"application/x-dtbncx+xml\" id=\"ncx\"/>\n' + \
-            '</manifest>\n' + \
-            '\n' + \
-            '<spine toc=\"ncx\">\n' + \
-            '    <itemref idref=\"page\"/>\n' + \
-            '    <itemref idref=\"catalog\"/>\n'
-        with open(os.path.join(self.path, 'content.opf'),
-                  'a',
-                  encoding='utf-8') as f:
-            for cid in self.catalog.keys():
-                f.write(
-                    f'    <item href=\"chapter_{cid}.xhtml\" id=\"{cid}\" media-type=\"application/xhtml+xml\"/>\n'
-                )
-            if self.cover_img_path is not None:
-                f.write(
-                    f'    <item id="cover-image" href="cover.{self.suffix}" media-type="image/{self.media_type}"/>\n'
-                )
-            f.write(cont1)
-            for cid in self.catalog.keys():
-                f.write(f'    <itemref idref=\"{cid}\"/>\n')
-            f.write('</spine>\n')
-            f.write('<guide>\n')
-            f.write(
-                '    <reference href=\"catalog.xhtml\" type=\"toc\" title=\"目录\"/>\n'
-            )
-            f.write('</guide>\n')
-            f.write('</package>\n')
-
-    def write_catalog(self) -> None:
-        '''write catalog.xhtml file'''
-        self.write_catalog_head()
-        with open(os.path.join(self.path, 'catalog.xhtml'),
-                  'a',
-                  encoding='utf-8') as f:
-            for cid, title in self.catalog.items():
-                f.write(
-                    f'        <li class=\"catalog\"><a href=\"chapter_{cid}.xhtml\">{title}</a></li>\n'
-                )
-            f.write(
-                '    </ul>\n    <div class=\"mbppagebreak\"></div>\n</body>\n</html>'
-            )
-
-    def write_toc(self) -> None:
-        '''write toc.ncx file'''
-        self.write_toc_head()
-        with open(os.path.join(self.path, 'toc.ncx'), 'a',
-                  encoding='utf-8') as f:
-            idx = 1
-            for cid, title in self.catalog.items():
-                f.write(
-                    f'<navPoint id=\"{cid}\" playOrder=\"{idx}\"><navLabel><text>{title}</text></navLabel><content src=\"chapter_{cid}.xhtml\"/></navPoint>\n'
-                )
-                idx += 1
-            f.write('</navMap>\n')
-            f.write('</ncx>')
+    def compression(self,
+                    clean: bool = True,
+                    incremental: bool = False,
+                    epub_path: str = None,
+                    books: List[zipfile.ZipFile] = None) -> str:
+        ''' compress the temp dir into `path`.epub
+
+        Args:
+            clean: if True, delete temp dir
+            incremental: if True, chapters which are not updated since the
+                last build (or not in the temp dir any more) are copied from
+                the epub files of the last build without recompression,
+                whichever (`path`.epub or a volume) holds them
+            epub_path: the output file, default is `path`.epub
+            books: opened epub files of the last build, see `old_books`. If
+                given, the caller closes them, and the output is written
+                into `epub_path`.tmp for the caller to replace `epub_path`
+
+        Returns:
+            the written file
+        '''
+        with self.stats.phase('compression') as stats:
+            epub_path = epub_path or self.path + '.epub'
+            own = books is None
+            if own:
+                books = self.old_books() if incremental else []
+            try:
+                out_path, files = self.compress_files(epub_path, books)
+            finally:
+                if own:
+                    for z in books:
+                        z.close()
+            if own:
+                if out_path != epub_path:
+                    os.replace(out_path, epub_path)
+                    out_path = epub_path
+                self.updated.clear()
+            stats.bytes += os.path.getsize(out_path)
+            stats.files += files
+            if clean:
+                shutil.rmtree(self.path)
+            return out_path
+
+    def compress_files(self, epub_path: str,
+                       books: List[zipfile.ZipFile]) -> Tuple[str, int]:
+        ''' write the temp dir, sources and entries of `books` into
+        `epub_path` (or `epub_path`.tmp if there are `books`), return the
+        written file and the number of its files
+        '''
+        # {name:the old epub holding it}, the first one wins
+        olds = {}
+        for z in books:
+            for name in z.NameToInfo:
+                olds.setdefault(name, z)
+        file_list = os.listdir(self.path)
+        chapters = {
+            f: cid
+            for cid in self.catalog.keys() for f in self.chapter_files(cid)
+        }
+        resources = set(r[0] for r in self.resources.values())
+        missing = set()
+        for f in list(chapters.keys()) + list(resources):
+            if f in self.sources:
+                # the source is not needed if the old book has the file
+                if not os.path.isfile(self.sources[f]):
+                    if f not in olds or f in chapters and \
+                            chapters[f] in self.updated:
+                        raise FileNotFoundError(
+                            f'File: {self.sources[f]} not exists!')
+                    missing.add(f)
+            elif not os.path.exists(os.path.join(self.path, f)):
+                if f not in olds:
+                    raise FileNotFoundError(f'File: {f} not exists!')
+                missing.add(f)
+
+        jobs = []
+        for f in self.archive_order(file_list):
+            if f in missing or f in chapters and f in olds and \
+                    chapters[f] not in self.updated:
+                jobs.append(partial(raw_entry, olds[f], f))
+            else:
+                # files added by `add_file` are read from their sources
+                filename = self.sources.get(f, os.path.join(self.path, f))
+                jobs.append(
+                    partial(deflate_file, filename, f, self.compress_type(f),
+                            self.compress_level))
+
+        out_path = epub_path + '.tmp' if books else epub_path
+        z = zipfile.ZipFile(out_path, 'w', zipfile.ZIP_DEFLATED)
+        try:
+            z.write(os.path.join(self.path, 'mimetype'),
+                    'mimetype',
+                    compress_type=zipfile.ZIP_STORED)
+            write_jobs(z, jobs, self.compress_workers)
+        finally:
+            z.close()
+        return out_path, len(jobs) + 1
+
+    def archive_order(self, file_list: List[str]) -> List[str]:
+        ''' files to compress in the order of manifest, except mimetype '''
+        order = ['META-INF/container.xml', 'content.opf', 'toc.ncx',
+                 'nav.xhtml', 'stylesheet.css', 'page.xhtml'
+                ] + self.catalog_files() + ['search.json']
+        if self.font is not None:
+            order.append(self.font_href)
+        if not self.nav:
+            order.remove('nav.xhtml')
+        if self.search is None:
+            order.remove('search.json')
+        order = [f for f in order if os.path.exists(os.path.join(self.path, f))]
+        order += [r[0] for r in self.resources.values()]
+        for cid in self.catalog.keys():
+            order += self.chapter_files(cid)
+        known = set(order)
+        known.add('mimetype')
+        for f in sorted(file_list):
+            # chapters not in catalog, old parts of a split chapter, files of
+            # unfinished chapters, or files of an earlier build with other
+            # settings
+            if f.startswith(('chapter_', 'catalog_')) and \
+                    f.endswith(('.xhtml', '.xhtml.part')) \
+                    or f in ('nav.xhtml', 'search.json', 'fonts', SOURCES_LOG):
+                continue
+            if os.path.isdir(os.path.join(self.path, f)):
+                for root, _, fs in os.walk(os.path.join(self.path, f)):
+                    for name in sorted(fs):
+                        name = os.path.relpath(os.path.join(root, name),
+                                               self.path).replace(os.sep, '/')
+                        if name not in known:
+                            order.append(name)
+            elif f not in known:
+                order.append(f)
+        return order
+
+    def navigation(self) -> Dict[str, str]:
+        ''' build content.opf, toc.ncx, catalog pages and nav.xhtml in one
+        pass over self.catalog, return {filename: content}
+        '''
+        catalog_files = self.catalog_files()
+        page_size = self.catalog_page_size or len(self.catalog) or 1
+        opf, spine, toc, nav = (io.StringIO() for _ in range(4))
+        catalogs = [io.StringIO() for _ in catalog_files]
+        self.write_opf_head(opf, '3.0' if self.nav else '2.0')
+        self.write_toc_head(toc, 2 if self.sections else 1)
+        for catalog in catalogs:
+            self.write_catalog_head(catalog)
+        nav.write(templates.NAV_HEAD)
+        opf_item = templates.OPF_ITEM.format
+        opf_itemref = templates.OPF_ITEMREF.format
+        toc_navpoint = templates.TOC_NAVPOINT.format
+        catalog_item = templates.CATALOG_ITEM.format
+        nav_item = templates.NAV_ITEM.format
+        section = 0  # number of sections so far
+        for order, (cid, title) in enumerate(self.catalog.items(), 1):
+            catalog = catalogs[(order - 1) // page_size]
+            if cid in self.sections:
+                if section:
+                    toc.write(templates.TOC_SECTION_TAIL)
+                    nav.write(templates.NAV_SECTION_TAIL)
+                section += 1
+                name = self.sections[cid]
+                toc.write(
+                    templates.TOC_SECTION_HEAD.format(index=section,
+                                                      order=order,
+                                                      title=name,
+                                                      cid=cid))
+                nav.write(templates.NAV_SECTION_HEAD.format(cid=cid, title=name))
+                catalog.write(templates.CATALOG_SECTION.format(title=name))
+            for k, f in enumerate(self.chapter_files(cid)):
+                item_id = f'{cid}-{k}' if k else cid
+                opf.write(opf_item(href=f, id=item_id))
+                spine.write(opf_itemref(id=item_id))
+            toc.write(toc_navpoint(cid=cid, title=title, order=order))
+            catalog.write(catalog_item(cid=cid, title=title))
+            nav.write(nav_item(cid=cid, title=title))
+        if section:
+            toc.write(templates.TOC_SECTION_TAIL)
+            nav.write(templates.NAV_SECTION_TAIL)
+        for href, rid, mtype in self.resources.values():
+            opf.write(
+                templates.OPF_RESOURCE.format(id=rid,
+                                              href=href,
+                                              media_type=mtype))
+        if self.search is not None:
+            opf.write(
+                templates.OPF_RESOURCE.format(id='search',
+                                              href='search.json',
+                                              media_type='application/json'))
+        if self.font is not None:
+            opf.write(
+                templates.OPF_RESOURCE.format(id='font',
+                                              href=self.font_href,
+                                              media_type=media_type(
+                                                  self.font_href)))
+        if self.nav:
+            opf.write(templates.OPF_NAV)
+        for k, f in enumerate(catalog_files[1:], 1):
+            opf.write(opf_item(href=f, id=f'catalog-{k}'))
+        opf.write(templates.OPF_SPINE)
+        for k in range(1, len(catalog_files)):
+            opf.write(opf_itemref(id=f'catalog-{k}'))
+        opf.write(spine.getvalue())
+        opf.write(templates.OPF_TAIL)
+        toc.write(templates.TOC_TAIL)
+        nav.write(templates.NAV_TAIL)
+        result = {'content.opf': opf.getvalue(), 'toc.ncx': toc.getvalue()}
+        for k, (f, catalog) in enumerate(zip(catalog_files, catalogs)):
+            catalog.write(templates.CATALOG_LIST_TAIL)
+            if k > 0:
+                catalog.write(
+                    templates.CATALOG_LINK.format(href=catalog_files[k - 1],
+                                                  text='上一页'))
+            if k + 1 < len(catalog_files):
+                catalog.write(
+                    templates.CATALOG_LINK.format(href=catalog_files[k + 1],
+                                                  text='下一页'))
+            catalog.write(templates.CATALOG_END)
+            result[f] = catalog.getvalue()
+        if self.nav:
+            result['nav.xhtml'] = nav.getvalue()
+        return result
+
+    def write_navigation(self) -> List[str]:
+        ''' write content.opf, toc.ncx, catalog pages and nav.xhtml files,
+        return their names
+        '''
+        navigation = self.navigation()
+        for name, content in navigation.items():
+            with self.open_file(name) as f:
+                f.write(content)
+        return list(navigation.keys())
 
 
 class EpubChapter():
@@ -174,19 +1022,8 @@ class EpubChapter():
     def __init__(self, title=''):
         self.chapter_title = title
         self.chapter = ''
-        self.head = '<?xml version=\"1.0\" encoding=\"utf-8\" standalone=\"no\"?>\n' + \
-            '<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.1//EN\" \"http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd\">\n' + \
-            '<html xmlns=\"http://www.w3.org/1999/xhtml\" xml:lang=\"zh-CN\">\n' + \
-            '<head>\n' + \
-            f'    <title>{title}</title>\n' + \
-            '    <link href=\"stylesheet.css\" type=\"text/css\" rel=\"stylesheet\"/>\n' + \
-            '    <style type=\"text/css\">\n' + \
-            '        @page { margin-bottom: 5.000000pt; margin-top: 5.000000pt; }\n' + \
-            '    </style>\n' + \
-            '</head>\n' + \
-            '<body>\n' + \
-            f'    <h2><span style=\"border-bottom:1px solid\">{title}</span></h2>\n'
-        self.tail = '    <div class=\"mbppagebreak\"></div>\n</body>\n</html>'
+        self.head = templates.CHAPTER_HEAD.format(title=title)
+        self.tail = templates.CHAPTER_TAIL
 
     def from_html_text(self, html_text: str, full: bool = False) -> str:
         if full:
@@ -196,10 +1033,212 @@ class EpubChapter():
 
         return self.chapter
 
-    def from_text(self, text: str or List[str]) -> str:
-        if not isinstance(text, List):
-            text = text.split('\n')
-        html_text = '    <p>' + '</p>\n    <p>'.join(text) + '</p>\n'
+    def from_text(self, text: str or Iterable[str]) -> str:
+        paragraph = templates.PARAGRAPH.format
+        html_text = ''.join(
+            paragraph(p) for p in EpubChapter.paragraphs(text))
         self.chapter = self.head + html_text + self.tail
 
-        return self.chapter
\ No newline at end of file
+        return self.chapter
+
+    @staticmethod
+    def blocks(html_text: str) -> Iterable[str]:
+        ''' split XHTML text after each </p>, for splitting large chapters '''
+        start = 0
+        while True:
+            end = html_text.find('</p>', start)
+            if end < 0:
+                if start < len(html_text):
+                    yield html_text[start:]
+                return
+            yield html_text[start:end + 4]
+            start = end + 4
+
+    @staticmethod
+    def paragraphs(text: str or Iterable[str]) -> Iterable[str]:
+        ''' yield paragraphs of a text one by one, a string is split by lines
+        without copying the whole text
+        '''
+        if not isinstance(text, str):
+            yield from text
+            return
+        start = 0
+        while True:
+            end = text.find('\n', start)
+            if end < 0:
+                yield text[start:]
+                return
+            yield text[start:end]
+            start = end + 1
+
+
+class ChapterWriter():
+    ''' write a chapter into the book piece by piece, see `Epub.chapter_writer`.
+
+    The chapter is added into the book only when it's closed. In the temp
+    dir, files are written as chapter_`id`.xhtml.part and renamed then, so
+    if writing fails (such as a generator of paragraphs raises), the
+    partial files are removed and an older version of the chapter is kept.
+    '''
+
+    def __init__(self,
+                 epub: Epub,
+                 cid: int,
+                 title: str,
+                 full: bool = False,
+                 order: float = None):
+        self.epub = epub
+        self.cid = cid = normalize_cid(cid)
+        self.title = title
+        self.order = order
+        self.chapter = EpubChapter(title)
+        self.full = full
+        self.size = 0
+        self.sha1 = hashlib.sha1()
+        self.start = time.perf_counter()
+        self.part = 0
+        self.part_size = 0
+        self.blocks = 0  # blocks in the current part
+        self.paragraphs = 0  # <p> written, for the search index
+        # tokens and characters of this chapter, moved into the book by close
+        self.search = IndexBuilder() if epub.search is not None else None
+        self.charset = set()
+        self.names = []  # files written
+        if epub.stream:
+            # the zip file can't write two entries at the same time
+            epub.stream_lock.acquire()
+        try:
+            self.f = self.open(f'chapter_{cid}.xhtml')
+        except BaseException:
+            self.release()
+            raise
+        if not full:
+            self.write(self.chapter.head)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort(exc_value)
+
+    def open(self, name: str) -> io.IOBase:
+        self.names.append(name)
+        if self.epub.stream:
+            return self.epub.open_file(name, 'wb')
+        return self.epub.open_file(name + '.part', 'wb')
+
+    def release(self) -> None:
+        if self.epub.stream:
+            self.epub.stream_lock.release()
+
+    def abort(self, exc: BaseException = None) -> None:
+        ''' give up the chapter, it's not added into the book '''
+        try:
+            self.f.close()
+        finally:
+            self.release()
+        if self.epub.stream:
+            # entries can't be removed from a zip file
+            raise RuntimeError(
+                f'Chapter {self.cid} is not finished, its partial file is '
+                f'left in {self.epub.path}.epub') from exc
+        for name in self.names:
+            try:
+                os.remove(os.path.join(self.epub.path, name + '.part'))
+            except FileNotFoundError:
+                pass
+
+    def write(self, html_text: str) -> None:
+        ''' write XHTML text as is '''
+        self.index(html_text)
+        self.collect(html_text)
+        self.write_bytes(html_text.encode('utf-8'))
+
+    def write_bytes(self, data: bytes) -> None:
+        self.size += len(data)
+        self.part_size += len(data)
+        self.sha1.update(data)
+        self.f.write(data)
+
+    def write_block(self, html_text: str) -> None:
+        ''' write a block of XHTML, such as a paragraph. If the current file
+        would exceed `Epub.max_chapter_size`, a new part is started before it
+        '''
+        self.index(html_text)
+        self.collect(html_text)
+        data = html_text.encode('utf-8')
+        limit = self.epub.max_chapter_size
+        if limit and not self.full and self.blocks and \
+                self.part_size + len(data) + len(self.chapter.tail) > limit:
+            self.next_part()
+        self.write_bytes(data)
+        self.blocks += 1
+
+    def index(self, html_text: str) -> None:
+        ''' add <p> of XHTML text into the search index '''
+        if self.search is not None:
+            self.paragraphs += self.search.add_html(self.cid, html_text,
+                                                    self.paragraphs)
+
+    def collect(self, html_text: str) -> None:
+        ''' add characters of XHTML text into the charset of the font,
+        character references such as &#x4e2d; are decoded first
+        '''
+        if self.epub.font is not None:
+            self.charset.update(plain_text(html_text))
+
+    def write_paragraph(self, text: str) -> None:
+        ''' write a paragraph, i.e. <p>text</p> '''
+        self.write_block(templates.PARAGRAPH.format(text))
+
+    def next_part(self) -> None:
+        self.write(self.chapter.tail)
+        self.f.close()
+        self.part += 1
+        self.part_size = 0
+        self.blocks = 0
+        self.f = self.open(f'chapter_{self.cid}-{self.part}.xhtml')
+        self.write(templates.CHAPTER_PART_HEAD.format(title=self.title))
+
+    def close(self) -> None:
+        ''' write XHTML tail and add the chapter into the book '''
+        try:
+            if not self.full:
+                self.write(self.chapter.tail)
+            self.f.close()
+        except BaseException as e:
+            self.abort(e)
+            raise
+        self.release()
+        epub = self.epub
+        cid = self.cid
+        if not epub.stream:
+            for name in self.names:
+                path = os.path.join(epub.path, name)
+                os.replace(path + '.part', path)
+            # parts of an older version, they would be taken as parts of this
+            # chapter by `resume`
+            for k in range(self.part + 1, epub.parts.get(cid, 1)):
+                try:
+                    os.remove(os.path.join(epub.path, f'chapter_{cid}-{k}.xhtml'))
+                except FileNotFoundError:
+                    pass
+        with epub.lock:
+            epub.catalog.add(cid, self.title, self.order)
+            if epub.sources.pop(f'chapter_{cid}.xhtml', None) is not None:
+                epub.log_source(f'chapter_{cid}.xhtml')
+            if self.part:
+                epub.parts[cid] = self.part + 1
+            else:
+                epub.parts.pop(cid, None)
+            if epub.search is not None:
+                epub.search.chapters[cid] = self.search.chapters.get(cid, {})
+            if epub.font is not None:
+                epub.charset.update(self.charset)
+                epub.charset_chapters.add(cid)
+            epub.record_chapter(cid, self.size, self.sha1.hexdigest())
+            epub.stats.add_chapter(cid, self.title, self.size, self.part + 1,
+                                   time.perf_counter() - self.start)
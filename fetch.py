@@ -0,0 +1,177 @@
+import time, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Tuple
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from cache import HttpCache
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class RateLimiter():
+    ''' limit the number of requests per second of each host '''
+
+    def __init__(self, rate: float = None) -> None:
+        '''
+        Args:
+            rate: max requests per second of a host, None for no limit
+        '''
+        self.interval = 1 / rate if rate else 0
+        self.next_time = {}  # {host: time}
+        self.lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time.get(host, now))
+            self.next_time[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class Fetcher():
+    ''' fetch pages concurrently with pooled connections.
+
+    Usage:
+        with Fetcher(workers=8, rate=5, headers=headers) as fetcher:
+            fetcher.create_chapters(epub, zip(ids, titles, urls), get_chapter)
+    '''
+
+    def __init__(self,
+                 workers: int = 8,
+                 rate: float = None,
+                 retries: int = 3,
+                 backoff: float = 0.5,
+                 timeout: float = 10,
+                 headers: dict = None,
+                 session: requests.Session = None,
+                 cache: HttpCache = None) -> None:
+        '''
+        Args:
+            workers: max number of concurrent requests
+            rate: max requests per second of each host, None for no limit
+            retries: times to retry a failed request (connection errors,
+                timeout, 429 and 5xx status)
+            backoff: wait backoff * 2^n seconds before the n-th retry
+            timeout: timeout of each request in seconds
+            headers: headers of all requests, such as User-Agent
+            session: a requests.Session to use, default is a new one
+            cache: a HttpCache, cached pages are revalidated with
+                conditional GETs and only downloaded again if changed
+        '''
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+        self.cache = cache
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=workers,
+                                  pool_maxsize=workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        if headers is not None:
+            session.headers.update(headers)
+        self.session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        ''' GET a url with rate limit and retries, raise
+        requests.HTTPError if it still fails. If a cache is set, a cached
+        response is returned when the server replies 304 Not Modified
+        '''
+        if self.cache is None:
+            return self.request(url, **kwargs)
+        if self.cache.fresh(url):
+            return self.cache.get(url)
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(self.cache.headers(url))
+        response = self.request(url, headers=headers, **kwargs)
+        if response.status_code == 304:
+            cached = self.cache.get(url)
+            if cached is not None:
+                return cached
+            # evicted by another thread, fetch it again
+            response = self.request(url, **kwargs)
+        self.cache.put(url, response)
+        return response
+
+    def request(self, url: str, **kwargs) -> requests.Response:
+        ''' GET a url with rate limit and retries, without cache '''
+        kwargs.setdefault('timeout', self.timeout)
+        for n in range(self.retries + 1):
+            self.limiter.wait(url)
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if n == self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS or \
+                        n == self.retries:
+                    response.raise_for_status()
+                    return response
+            time.sleep(self.backoff * 2**n)
+
+    def map(self, func: Callable[[requests.Response], object],
+            urls: Iterable[str]) -> Iterator:
+        ''' fetch urls concurrently, yield func(response) in the order of
+        `urls`, no matter which request finishes first
+        '''
+
+        def job(url):
+            return func(self.get(url))
+
+        window = deque()
+        with ThreadPoolExecutor(self.workers) as pool:
+            for url in urls:
+                window.append(pool.submit(job, url))
+                if len(window) >= self.workers * 2:
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
+
+    def create_chapters(self,
+                        epub,
+                        chapters: Iterable[Tuple[object, str, str]],
+                        parse: Callable[[requests.Response], object],
+                        html: bool = False) -> None:
+        ''' fetch chapters and create them in `epub` concurrently, each
+        chapter is written by the thread which fetches it, the book keeps
+        the order of `chapters`
+
+        Args:
+            epub: an Epub
+            chapters: (id, title, url) of each chapter
+            parse: get the content from a response, the result is passed
+                to `epub.create_chapter` as text
+            html: html argument of `epub.create_chapter`
+        '''
+        chapters = list(chapters)
+        first = epub.catalog.reserve(len(chapters))
+
+        def job(order, cid, title, url):
+            content = parse(self.get(url))
+            epub.create_chapter(cid, title, content, html, order=order)
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = [
+                pool.submit(job, first + k, *chapter)
+                for k, chapter in enumerate(chapters)
+            ]
+            for future in futures:
+                future.result()
@@ -0,0 +1,57 @@
+''' Subset fonts to the characters used in a book, see `Epub.set_font`.
+
+A CJK font is 10~20 MB, but a book only uses a few thousand characters,
+the subset font is usually a few hundred KB.
+Requires fontTools: `pip install fonttools` (and `brotli` for woff2).
+'''
+import io
+from typing import Iterable
+
+try:
+    from fontTools import subset
+except ImportError:  # embedding fonts is optional
+    subset = None
+
+FLAVORS = (None, 'woff', 'woff2')
+
+
+def require() -> None:
+    if subset is None:
+        raise ImportError(
+            'fontTools is required to embed fonts: pip install fonttools')
+
+
+def font_suffix(filename: str, flavor: str = None) -> str:
+    ''' suffix of the subset font, such as ttf, otf, woff '''
+    if flavor is not None:
+        return flavor
+    return filename.rsplit('.', 1)[-1].lower()
+
+
+def subset_font(filename: str, chars: Iterable[str], flavor: str = None) -> bytes:
+    ''' keep only glyphs of `chars` in a font
+
+    Args:
+        filename: font file path, ttf or otf
+        chars: characters to keep
+        flavor: None to keep the format of the font, 'woff' or 'woff2'
+
+    Returns:
+        the subset font file
+    '''
+    require()
+    options = subset.Options()
+    options.flavor = flavor
+    # keep the font usable for vertical text and punctuation alternates
+    options.layout_features = ['*']
+    options.notdef_outline = True
+    font = subset.load_font(filename, options)
+    try:
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(text=''.join(chars))
+        subsetter.subset(font)
+        buffer = io.BytesIO()
+        subset.save_font(font, buffer, options)
+    finally:
+        font.close()
+    return buffer.getvalue()
@@ -0,0 +1,106 @@
+''' Clean up paragraphs of plain text before writing them into chapters.
+
+Each paragraph is handled once in a few regex passes, so a chapter is
+normalized in linear time:
+
+    1. unescape HTML entities, such as &nbsp; from crawled pages (optional)
+    2. remove control and zero-width characters, which are invalid in XHTML
+    3. collapse whitespace, including full-width spaces, strip both ends
+    4. drop empty lines and boilerplate lines
+    5. convert traditional/simplified Chinese with OpenCC (optional)
+    6. escape &, < and >
+
+Usage:
+    normalizer = Normalizer(boilerplate=['请记住本书首发域名'], unescape=True)
+    epub.set_normalizer(normalizer)  # used by create_chapter(..., html=False)
+    paragraphs = list(normalizer.paragraphs(text))
+'''
+import re, html
+from typing import Iterable, List, Tuple
+from epub import EpubChapter
+
+try:
+    import opencc
+except ImportError:  # conversion is optional
+    opencc = None
+
+INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\u200b\ufeff]')
+# \s matches full-width space (　) and no-break space (\xa0) as well
+WHITESPACE = re.compile(r'\s+')
+
+
+class Normalizer():
+
+    def __init__(self,
+                 boilerplate: List[str] = None,
+                 convert: str = None,
+                 unescape: bool = False,
+                 escape: bool = True) -> None:
+        '''
+        Args:
+            boilerplate: regular expressions, lines containing any of them are
+                dropped, such as ads of the source website
+            convert: OpenCC config, such as 't2s' (traditional to simplified)
+                or 's2t', requires `pip install opencc`
+            unescape: if True, unescape HTML entities first, for text taken
+                from HTML pages
+            escape: if True, escape &, < and >, set False if the text is
+                XHTML already
+        '''
+        self.boilerplate = None
+        if boilerplate:
+            self.boilerplate = re.compile('|'.join(
+                f'(?:{p})' for p in boilerplate))
+        self.converter = None
+        if convert is not None:
+            if opencc is None:
+                raise ImportError(
+                    'opencc is required to convert text: pip install opencc')
+            self.converter = opencc.OpenCC(convert)
+        self.unescape = unescape
+        self.escape = escape
+
+    def clean(self, text: str) -> str:
+        ''' steps 1~3 of a line '''
+        if self.unescape:
+            text = html.unescape(text)
+        text = INVALID_CHARS.sub('', text)
+        return WHITESPACE.sub(' ', text).strip()
+
+    def finish(self, text: str) -> str:
+        ''' steps 5~6 of a cleaned line '''
+        if self.converter is not None:
+            text = self.converter.convert(text)
+        if self.escape:
+            text = html.escape(text, quote=False)
+        return text
+
+    def paragraph(self, text: str) -> str or None:
+        ''' normalize a paragraph, None if it should be dropped '''
+        text = self.clean(text)
+        if not text or self.boilerplate is not None and \
+                self.boilerplate.search(text):
+            return None
+        return self.finish(text)
+
+    def paragraphs(self, text: str or Iterable[str]) -> Iterable[str]:
+        ''' yield normalized paragraphs of a text one by one, a string is
+        split by lines, see `EpubChapter.paragraphs`
+        '''
+        for p in EpubChapter.paragraphs(text):
+            p = self.paragraph(p)
+            if p is not None:
+                yield p
+
+    def title(self, text: str) -> str:
+        ''' normalize a title, it's never dropped '''
+        return self.finish(self.clean(text))
+
+    def chapters(
+        self, chapters: Iterable[Tuple[int, str, str or Iterable[str]]]
+    ) -> Iterable[Tuple[int, str, List[str]]]:
+        ''' normalize a batch of chapters (id, title, text), yield
+        (id, title, paragraphs) one by one
+        '''
+        for cid, title, text in chapters:
+            yield cid, self.title(title), list(self.paragraphs(text))
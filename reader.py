@@ -0,0 +1,136 @@
+import re, posixpath, zipfile
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List
+from urllib.parse import unquote
+
+NS = {
+    'container': 'urn:oasis:names:tc:opendocument:xmlns:container',
+    'opf': 'http://www.idpf.org/2007/opf',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'ncx': 'http://www.daisy.org/z3986/2005/ncx/',
+}
+
+
+class EpubReader():
+    ''' read an existing epub file without extracting it.
+
+    Only the zip's central directory, container.xml, content.opf and
+    toc.ncx are read when opened, chapters are read on demand.
+
+    Usage:
+        with EpubReader('book.epub') as book:  # or Epub.open('book.epub')
+            print(book.title, book.catalog)
+            xhtml = book.chapter(cid)
+    '''
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.zip = zipfile.ZipFile(filename)
+        try:
+            self.load()
+        except Exception:
+            self.zip.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.zip.close()
+
+    def load(self) -> None:
+        try:
+            container = ET.fromstring(self.zip.read('META-INF/container.xml'))
+        except KeyError:
+            raise ValueError(f'{self.filename} is not an epub file')
+        self.opf_path = container.find('.//container:rootfile',
+                                       NS).get('full-path')
+        opf = ET.fromstring(self.zip.read(self.opf_path))
+
+        metadata = opf.find('opf:metadata', NS)
+        self.title = metadata.findtext('dc:title', '', NS)
+        self.author = [e.text for e in metadata.findall('dc:creator', NS)]
+        self.lang = metadata.findtext('dc:language', '', NS)
+
+        self.manifest = {}  # {id:(path in zip, media type)}
+        for item in opf.find('opf:manifest', NS):
+            self.manifest[item.get('id')] = (self.resolve(
+                self.opf_path, item.get('href')), item.get('media-type'))
+        spine = opf.find('opf:spine', NS)
+        self.spine = [self.manifest[i.get('idref')][0] for i in spine]
+
+        self.catalog = {}  # {id:title}
+        self.hrefs = {}  # {id:path in zip}
+        toc = spine.get('toc')
+        if toc is not None and toc in self.manifest:
+            ncx_path = self.manifest[toc][0]
+            ncx = ET.fromstring(self.zip.read(ncx_path))
+            for point in ncx.iter(f'{{{NS["ncx"]}}}navPoint'):
+                if point.find('ncx:navPoint', NS) is not None:
+                    continue  # a section of chapters
+                cid = point.get('id')
+                self.catalog[cid] = point.findtext('ncx:navLabel/ncx:text',
+                                                   '', NS)
+                src = point.find('ncx:content', NS).get('src')
+                self.hrefs[cid] = self.resolve(ncx_path, src)
+        self.spine_pos = {f: i for i, f in enumerate(self.spine)}
+        self.starts = set(self.hrefs.values())
+
+    @staticmethod
+    def resolve(base: str, href: str) -> str:
+        ''' path in zip of `href` relative to the file `base` '''
+        href = unquote(href.split('#')[0])
+        return posixpath.normpath(posixpath.join(posixpath.dirname(base), href))
+
+    def key(self, cid) -> str:
+        ''' ids are strings in the epub, accept int ids of Epub.catalog '''
+        cid = str(cid)
+        if cid not in self.hrefs:
+            raise KeyError(f'Chapter: {cid} not exists!')
+        return cid
+
+    def read(self, name: str) -> bytes:
+        ''' read a file in the epub, such as an image '''
+        return self.zip.read(name)
+
+    def chapter(self, cid) -> str:
+        ''' XHTML of a chapter (the first file of a split chapter) '''
+        return self.zip.read(self.hrefs[self.key(cid)]).decode('utf-8')
+
+    def chapter_files(self, cid) -> List[str]:
+        ''' files of a chapter, i.e. files in spine from the chapter
+        to the next item of the catalog
+        '''
+        start = self.hrefs[self.key(cid)]
+        if start not in self.spine_pos:
+            return [start]
+        files = [start]
+        for i in range(self.spine_pos[start] + 1, len(self.spine)):
+            if self.spine[i] in self.starts:
+                break
+            files.append(self.spine[i])
+        return files
+
+    def chapter_parts(self, cid) -> List[str]:
+        ''' XHTML of all files of a chapter '''
+        return [
+            self.zip.read(f).decode('utf-8') for f in self.chapter_files(cid)
+        ]
+
+    def paragraphs(self, cid) -> Iterable[str]:
+        ''' yield contents of <p> of a chapter one by one '''
+        for f in self.chapter_files(cid):
+            text = self.zip.read(f).decode('utf-8')
+            for m in re.finditer(r'<p(?:\s[^>]*)?>(.*?)</p>', text, re.DOTALL):
+                yield m.group(1)
+
+    def info(self) -> Dict[str, object]:
+        return {
+            'title': self.title,
+            'author': self.author,
+            'lang': self.lang,
+            'chapters': len(self.catalog)
+        }
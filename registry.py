@@ -0,0 +1,109 @@
+import threading
+from typing import Iterator, List, Tuple
+
+
+def normalize_cid(cid):
+    ''' ids are used in file names, so '12' and 12 are the same chapter,
+    a string of digits is turned into int, e.g. ids parsed from urls
+    '''
+    if isinstance(cid, str) and cid.isdigit() and str(int(cid)) == cid:
+        return int(cid)
+    return cid
+
+
+class ChapterRegistry():
+    ''' {id:title} of chapters, which can be added from many threads.
+
+    Each chapter has a sort key, chapters are iterated in the order of
+    their keys, so spine, toc and catalog don't depend on the order in
+    which threads add chapters. By default the key is a sequence number,
+    i.e. the order of adding, pass `order` (see `Epub.create_chapter`) or
+    `reserve` numbers for chapters which are created concurrently.
+    '''
+
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self.titles = {}  # {id:title}
+        self.orders = {}  # {id:sort key}
+        self.sequence = 0  # the next key
+        self.ordered = None  # cache of sorted ids
+
+    def add(self, cid, title: str, order: float = None) -> None:
+        ''' add a chapter, or update its title (and key if `order` is given)
+
+        Args:
+            cid: chapter id
+            title: chapter name
+            order: sort key, default is the next sequence number for a new
+                chapter, or the old key for an existing chapter
+        '''
+        cid = normalize_cid(cid)
+        with self.lock:
+            if order is None:
+                order = self.orders.get(cid)
+            if order is None:
+                order = self.sequence
+            if self.orders.get(cid) != order:
+                self.orders[cid] = order
+                self.ordered = None
+            if isinstance(order, (int, float)) and order >= self.sequence:
+                self.sequence = int(order) + 1
+            self.titles[cid] = title
+
+    def reserve(self, n: int) -> int:
+        ''' reserve n sequence numbers for chapters added later, return the
+        first one, the k-th chapter should be added with order=first+k
+        '''
+        with self.lock:
+            first = self.sequence
+            self.sequence += n
+            return first
+
+    def ids(self) -> List:
+        ''' ids sorted by their keys (ties by id) '''
+        with self.lock:
+            if self.ordered is None:
+                self.ordered = sorted(self.orders,
+                                      key=lambda c: (self.orders[c], str(c)))
+            return self.ordered
+
+    def order(self, cid):
+        return self.orders[normalize_cid(cid)]
+
+    def __setitem__(self, cid, title: str) -> None:
+        self.add(cid, title)
+
+    def __getitem__(self, cid) -> str:
+        return self.titles[normalize_cid(cid)]
+
+    def __contains__(self, cid) -> bool:
+        return normalize_cid(cid) in self.titles
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def __iter__(self) -> Iterator:
+        return iter(self.ids())
+
+    def __delitem__(self, cid) -> None:
+        cid = normalize_cid(cid)
+        with self.lock:
+            del self.titles[cid]
+            del self.orders[cid]
+            self.ordered = None
+
+    def keys(self) -> List:
+        return self.ids()
+
+    def values(self) -> List[str]:
+        return [self.titles[cid] for cid in self.ids()]
+
+    def items(self) -> List[Tuple[object, str]]:
+        with self.lock:
+            return [(cid, self.titles[cid]) for cid in self.ids()]
+
+    def get(self, cid, default: str = None) -> str:
+        return self.titles.get(normalize_cid(cid), default)
+
+    def __repr__(self) -> str:
+        return f'ChapterRegistry({dict(self.items())})'
@@ -0,0 +1,222 @@
+''' Full-text search index of books.
+
+Text is split into tokens: runs of CJK characters into bigrams (a single
+character run is a token itself), runs of letters and digits into lowercase
+words. The index maps each token to the paragraphs containing it, a
+paragraph is (chapter id, offset), the offset counts <p> of the chapter from
+0, the same as `EpubReader.paragraphs`.
+
+The index is saved as search.json in the book (see `Epub.set_search`):
+
+    {
+        "version": 1,
+        "chapters": [cid, ...],
+        "postings": {token: [chapter, offset, chapter, offset, ...]}
+    }
+
+chapter is the position in "chapters", stored as the delta from the previous
+chapter of the same token to keep the file small.
+
+Usage:
+    index = SearchIndex.load('book.epub')
+    for cid, offset in index.search('关键词'):
+        ...
+    library = SearchIndex.merge({'book1': index1, 'book2': index2})
+    for (book, cid), offset in library.search('关键词'):
+        ...
+'''
+import re, json, html, zipfile
+from typing import Dict, Iterable, List, Tuple
+
+VERSION = 1
+CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af'
+TOKEN = re.compile(f'([{CJK}]+)|([0-9A-Za-z]+)')
+CJK_CHAR = re.compile(f'[{CJK}]')
+PARAGRAPH = re.compile(r'<p(?:\s[^>]*)?>(.*?)</p>', re.DOTALL)
+TAG = re.compile(r'<[^>]*>')
+
+
+def tokens(text: str) -> Iterable[str]:
+    ''' yield tokens of plain text one by one '''
+    for m in TOKEN.finditer(text):
+        run = m.group(1)
+        if run is None:
+            yield m.group(2).lower()
+        elif len(run) == 1:
+            yield run
+        else:
+            yield from [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def plain_text(html_text: str) -> str:
+    ''' text of XHTML without tags and entities '''
+    return html.unescape(TAG.sub('', html_text))
+
+
+class IndexBuilder():
+    ''' collect tokens of chapters while they are written, see
+    `Epub.set_search`
+    '''
+
+    def __init__(self) -> None:
+        self.chapters = {}  # {id:{token:[offset]}}
+
+    def start(self, cid) -> None:
+        ''' (re)start a chapter, its old tokens are dropped '''
+        self.chapters[cid] = {}
+
+    def add_paragraph(self, cid, offset: int, text: str) -> None:
+        ''' index a paragraph of plain text '''
+        chapter = self.chapters.setdefault(cid, {})
+        for token in set(tokens(text)):
+            offsets = chapter.get(token)
+            if offsets is None:
+                chapter[token] = [offset]
+            else:
+                offsets.append(offset)
+
+    def add_html(self, cid, html_text: str, offset: int = 0) -> int:
+        ''' index each <p> of XHTML text, the first one is at `offset`,
+        return the number of <p>
+        '''
+        count = 0
+        for m in PARAGRAPH.finditer(html_text):
+            self.add_paragraph(cid, offset + count, plain_text(m.group(1)))
+            count += 1
+        return count
+
+    def load(self, index: dict, cids: Iterable) -> None:
+        ''' take chapters `cids` from a saved index, such as the index of
+        the last build
+        '''
+        cids = set(cids)
+        chapters = index['chapters']
+        for token, postings in index['postings'].items():
+            chapter = 0
+            for i in range(0, len(postings), 2):
+                chapter += postings[i]
+                cid = chapters[chapter]
+                if cid in cids:
+                    self.chapters.setdefault(cid, {}).setdefault(
+                        token, []).append(postings[i + 1])
+        for cid in cids:
+            if cid in chapters:
+                self.chapters.setdefault(cid, {})
+
+    def to_dict(self, cids: Iterable) -> dict:
+        ''' the index of chapters `cids` in order, see the format above '''
+        chapters = [cid for cid in cids if cid in self.chapters]
+        postings = {}
+        last = {}  # {token:position of the last chapter}
+        for i, cid in enumerate(chapters):
+            for token, offsets in self.chapters[cid].items():
+                p = postings.setdefault(token, [])
+                p.append(i - last.get(token, 0))
+                p.append(offsets[0])
+                for offset in offsets[1:]:
+                    p.append(0)
+                    p.append(offset)
+                last[token] = i
+        return {'version': VERSION, 'chapters': chapters, 'postings': postings}
+
+
+class SearchIndex():
+    ''' a loaded index, to search paragraphs of a book (or books) '''
+
+    def __init__(self, index: dict) -> None:
+        if index.get('version') != VERSION:
+            raise ValueError(
+                f'Unsupported search index version: {index.get("version")}')
+        # ids of a merged index are lists in JSON
+        self.chapters = [
+            tuple(c) if isinstance(c, list) else c for c in index['chapters']
+        ]
+        self.postings = index['postings']
+
+    @staticmethod
+    def load(filename: str) -> 'SearchIndex':
+        ''' load the index of an epub file, or a saved index (JSON) '''
+        if zipfile.is_zipfile(filename):
+            with zipfile.ZipFile(filename) as z:
+                if 'search.json' not in z.NameToInfo:
+                    raise ValueError(f'{filename} has no search index')
+                return SearchIndex(json.loads(z.read('search.json')))
+        with open(filename, 'r', encoding='utf-8') as f:
+            return SearchIndex(json.load(f))
+
+    def save(self, filename: str) -> None:
+        content = json.dumps(self.to_dict(),
+                             ensure_ascii=False,
+                             separators=(',', ':'))
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def to_dict(self) -> dict:
+        return {
+            'version': VERSION,
+            'chapters': self.chapters,
+            'postings': self.postings
+        }
+
+    def paragraphs(self, token: str) -> List[Tuple[int, int]]:
+        ''' (chapter position, offset) of paragraphs containing a token '''
+        postings = self.postings.get(token, [])
+        result = []
+        chapter = 0
+        for i in range(0, len(postings), 2):
+            chapter += postings[i]
+            result.append((chapter, postings[i + 1]))
+        return result
+
+    def search(self, query: str, limit: int = None) -> List[Tuple[object, int]]:
+        ''' (chapter id, offset) of paragraphs containing all tokens of the
+        query, in the order of the book.
+
+        Tokens are matched, not the whole query, a paragraph containing
+        every bigram of the query is a match even if they are apart.
+        A query of a single CJK character scans all tokens, it's slower.
+
+        Args:
+            query: text to search
+            limit: max number of results, None for all
+        '''
+        found = None
+        for token in sorted(set(tokens(query)),
+                            key=lambda t: len(self.postings.get(t, ()))):
+            if len(token) == 1 and CJK_CHAR.match(token):
+                paragraphs = set()
+                for t in self.postings:
+                    if token in t:
+                        paragraphs.update(self.paragraphs(t))
+            else:
+                paragraphs = set(self.paragraphs(token))
+            found = paragraphs if found is None else found & paragraphs
+            if not found:
+                return []
+        if found is None:
+            return []
+        result = [(self.chapters[c], offset) for c, offset in sorted(found)]
+        return result[:limit] if limit is not None else result
+
+    @staticmethod
+    def merge(indexes: Dict[str, 'SearchIndex']) -> 'SearchIndex':
+        ''' merge indexes of books into one, chapter ids of the merged index
+        are (book name, chapter id)
+        '''
+        chapters = []
+        postings = {}
+        last = {}  # {token:position of the last chapter}
+        for name, index in indexes.items():
+            base = len(chapters)
+            chapters += [(name, cid) for cid in index.chapters]
+            for token in index.postings:
+                p = postings.setdefault(token, [])
+                for chapter, offset in index.paragraphs(token):
+                    p.append(base + chapter - last.get(token, 0))
+                    p.append(offset)
+                    last[token] = base + chapter
+        return SearchIndex({
+            'version': VERSION,
+            'chapters': chapters,
+            'postings': postings
+        })
@@ -0,0 +1,85 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+
+class PhaseStats():
+    ''' counters of a phase, accumulated if the phase runs more than once '''
+
+    def __init__(self) -> None:
+        self.seconds = 0.0
+        self.bytes = 0
+        self.files = 0
+        self.calls = 0
+
+    def to_dict(self) -> dict:
+        return {
+            'seconds': self.seconds,
+            'bytes': self.bytes,
+            'files': self.files,
+            'calls': self.calls
+        }
+
+    def __repr__(self) -> str:
+        return f'PhaseStats(seconds={self.seconds:.4f}, bytes={self.bytes}, ' + \
+            f'files={self.files}, calls={self.calls})'
+
+
+class BuildStats():
+    ''' timing, byte and file counters of each phase of a build:
+    chapters (writing chapters), font (subsetting the embedded font),
+    metadata (opf, ncx, catalog ...), compression and index.
+
+    Hooks (see `Epub.set_hooks`) are called when a phase starts or ends,
+    and when a chapter is written.
+    '''
+
+    def __init__(self, hooks: Dict[str, Callable] = None) -> None:
+        self.phases = {}  # {name:PhaseStats}
+        self.hooks = hooks if hooks is not None else {}
+
+    def __getitem__(self, name: str) -> PhaseStats:
+        if name not in self.phases:
+            self.phases[name] = PhaseStats()
+        return self.phases[name]
+
+    def __repr__(self) -> str:
+        return f'BuildStats({self.phases})'
+
+    @property
+    def seconds(self) -> float:
+        return sum(p.seconds for p in self.phases.values())
+
+    def emit(self, hook: str, *args) -> None:
+        func = self.hooks.get(hook)
+        if func is not None:
+            func(*args)
+
+    @contextmanager
+    def phase(self, name: str):
+        ''' time a phase, yield its PhaseStats to count bytes and files '''
+        stats = self[name]
+        self.emit('on_phase_start', name)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.seconds += time.perf_counter() - start
+            stats.calls += 1
+            self.emit('on_phase_end', name, stats)
+
+    def add_chapter(self, cid, title: str, size: int, files: int,
+                    seconds: float) -> None:
+        ''' count a written chapter in the chapters phase '''
+        stats = self['chapters']
+        stats.seconds += seconds
+        stats.bytes += size
+        stats.files += files
+        stats.calls += 1
+        self.emit('on_chapter_written', cid, title, size, seconds)
+
+    def to_dict(self) -> dict:
+        return {
+            'seconds': self.seconds,
+            'phases': {k: v.to_dict() for k, v in self.phases.items()}
+        }
@@ -0,0 +1,217 @@
+''' XHTML, OPF and NCX templates of the book.
+
+Templates are built once when imported, fill them with `str.format`.
+'''
+
+CONTAINER = '<?xml version=\"1.0\"?>\n' + \
+    '<container version=\"1.0\" xmlns=\"urn:oasis:names:tc:opendocument:xmlns:container\">\n' + \
+    '   <rootfiles>\n' + \
+    '      <rootfile full-path=\"content.opf\" media-type=\"application/oebps-package+xml\"/>\n' + \
+    '   </rootfiles>\n' + \
+    '</container>'
+
+MIMETYPE = 'application/epub+zip'
+
+STYLESHEET = 'body{\n' + \
+    '    margin:10px;\n' + \
+    '    font-size: 1.0em;\n' + \
+    '}\n' + \
+    'ul,li{list-style-type:none;margin:0;padding:0;}\n' + \
+    '\n' + \
+    'p{text-indent:2em; line-height:1.5em; margin-top:0; margin-bottom:1.5em;}\n' + \
+    '\n' + \
+    '.catalog{line-height:2.5em;font-size: 0.8em;}\n' + \
+    'li{border-bottom: 1px solid #D5D5D5;}\n' + \
+    'h1{font-size:1.6em; font-weight:bold;}\n' + \
+    '\n' + \
+    'h2 {\n' + \
+    '    display: block;\n' + \
+    '    font-size: 1.2em;\n' + \
+    '    font-weight: bold;\n' + \
+    '    margin-bottom: 0.83em;\n' + \
+    '    margin-left: 0;\n' + \
+    '    margin-right: 0;\n' + \
+    '    margin-top: 1em;\n' + \
+    '}\n' + \
+    '\n' + \
+    '.mbppagebreak {\n' + \
+    '    display: block;\n' + \
+    '    margin-bottom: 0;\n' + \
+    '    margin-left: 0;\n' + \
+    '    margin-right: 0;\n' + \
+    '    margin-top: 0 }\n' + \
+    'a {\n' + \
+    '    color: inherit;\n' + \
+    '    text-decoration: none;\n' + \
+    '    cursor: default\n' + \
+    '    }\n' + \
+    'a[href] {\n' + \
+    '    color: blue;\n' + \
+    '    text-decoration: none;\n' + \
+    '    cursor: pointer\n' + \
+    '    }\n' + \
+    '\n' + \
+    '.italic {\n' + \
+    '    font-style: italic\n' + \
+    '    }'
+
+# an embedded font of all text, format with family, href
+FONT_FACE = '\n' + \
+    '@font-face {{\n' + \
+    '    font-family: \"{family}\";\n' + \
+    '    src: url({href});\n' + \
+    '}}\n' + \
+    'body {{ font-family: \"{family}\", serif; }}\n'
+
+# format with title, authors, intro
+PAGE = '<?xml version=\"1.0\" encoding=\"utf-8\" standalone=\"no\"?>\n' + \
+    '<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.1//EN\" \"http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd\">\n' + \
+    '<html xmlns=\"http://www.w3.org/1999/xhtml\" xml:lang=\"zh-CN\">\n' + \
+    '    <head>\n' + \
+    '        <meta http-equiv=\"Content-Type\" content=\"text/html; charset=UTF-8\"/>\n' + \
+    '        <title>书籍信息</title>\n' + \
+    '        <style type=\"text/css\" title=\"override_css\">\n' + \
+    '            @page {{padding: 0pt; margin:0pt}}\n' + \
+    '            body {{ text-align: left; padding:0pt; margin: 0pt;font-size: 1.0em}}\n' + \
+    '            ul,li{{list-style-type:none;margin:0;padding:0;line-height: 1.5em;font-size: 1.0em}}\n' + \
+    '            h1{{font-size:1.5em}}\n' + \
+    '            h2 {{font-size: 1.2em}}\n' + \
+    '		.copyright{{color:#646464}}\n' + \
+    '        </style>\n' + \
+    '    </head>\n' + \
+    '    <body>\n' + \
+    '        <div>\n' + \
+    '            <h1>{title}</h1>\n' + \
+    '            <h2>作者：{authors}</h2>\n' + \
+    '        <ul><li><b>内容简介：</b></li>\n' + \
+    '            <li>{intro}</li>\n' + \
+    '            <li><br/></li>\n' + \
+    '            <li class=\"copyright\">Epub is created by <b>epubook</b></li>\n' + \
+    '            <li class=\"copyright\">github: [<b><a href=\"https://github.com/JintaoLee-Roger/epubook\" target=\"_blank\">JintaoLee-Roger/crawler</a></b>]</li>\n' + \
+    '        </ul>\n' + \
+    '        </div>\n' + \
+    '    </body>\n' + \
+    '</html>'
+
+# format with title
+CHAPTER_HEAD = '<?xml version=\"1.0\" encoding=\"utf-8\" standalone=\"no\"?>\n' + \
+    '<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.1//EN\" \"http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd\">\n' + \
+    '<html xmlns=\"http://www.w3.org/1999/xhtml\" xml:lang=\"zh-CN\">\n' + \
+    '<head>\n' + \
+    '    <title>{title}</title>\n' + \
+    '    <link href=\"stylesheet.css\" type=\"text/css\" rel=\"stylesheet\"/>\n' + \
+    '    <style type=\"text/css\">\n' + \
+    '        @page {{ margin-bottom: 5.000000pt; margin-top: 5.000000pt; }}\n' + \
+    '    </style>\n' + \
+    '</head>\n' + \
+    '<body>\n' + \
+    '    <h2><span style=\"border-bottom:1px solid\">{title}</span></h2>\n'
+# head of the 2nd, 3rd... part of a split chapter, format with title
+CHAPTER_PART_HEAD = CHAPTER_HEAD[:CHAPTER_HEAD.index('    <h2>')]
+CHAPTER_TAIL = '    <div class=\"mbppagebreak\"></div>\n</body>\n</html>'
+PARAGRAPH = '    <p>{}</p>\n'
+
+CATALOG_HEAD = '<?xml version=\"1.0\" encoding=\"utf-8\" standalone=\"no\"?>\n' + \
+    '<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.1//EN\" \"http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd\">\n' + \
+    '<html xmlns=\"http://www.w3.org/1999/xhtml\" xml:lang=\"zh-CN\">\n' + \
+    '<head>\n' + \
+    '    <title>目录</title>\n' + \
+    '    <link href=\"stylesheet.css\" type=\"text/css\" rel=\"stylesheet\"/>\n' + \
+    '    <style type=\"text/css\">\n' + \
+    '        @page { margin-bottom: 5.000000pt; margin-top: 5.000000pt; }\n' + \
+    '    </style>\n' + \
+    '</head>\n' + \
+    '<body>\n' + \
+    '    <h1>目录<br/>Content</h1>\n' + \
+    '    <ul>\n'
+# format with cid, title
+CATALOG_ITEM = '        <li class=\"catalog\"><a href=\"chapter_{cid}.xhtml\">{title}</a></li>\n'
+# format with title
+CATALOG_SECTION = '        <li class=\"catalog\"><b>{title}</b></li>\n'
+CATALOG_LIST_TAIL = '    </ul>\n'
+# link to the previous or next catalog page, format with href, text
+CATALOG_LINK = '    <p class=\"catalog\"><a href=\"{href}\">{text}</a></p>\n'
+CATALOG_END = '    <div class=\"mbppagebreak\"></div>\n</body>\n</html>'
+
+# format with title, authors, depth
+TOC_HEAD = '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n' + \
+    '<ncx xmlns=\"http://www.daisy.org/z3986/2005/ncx/\" version=\"2005-1\">\n' + \
+    '<head>\n' + \
+    '    <meta content=\"epubook:000000\" name=\"dtb:uid\"/>\n' + \
+    '    <meta content=\"{depth}\" name=\"dtb:depth\"/>\n' + \
+    '    <meta content=\"epubook [https://github.com/JintaoLee-Roger/crawler]\" name=\"dtb:generator\"/>\n' + \
+    '    <meta content=\"0\" name=\"dtb:totalPageCount\"/>\n' + \
+    '    <meta content=\"0\" name=\"dtb:maxPageNumber\"/>\n' + \
+    '</head>\n' + \
+    '<docTitle>\n' + \
+    '    <text>{title}</text>\n' + \
+    '</docTitle>\n' + \
+    '<docAuthor>\n' + \
+    '    <text>{authors}</text>\n' + \
+    '</docAuthor>\n' + \
+    '<navMap>\n'
+# format with cid, title, order
+TOC_NAVPOINT = '<navPoint id=\"{cid}\" playOrder=\"{order}\"><navLabel><text>{title}</text></navLabel><content src=\"chapter_{cid}.xhtml\"/></navPoint>\n'
+# a navPoint of a section and its chapters, format with index, order, title, cid
+TOC_SECTION_HEAD = '<navPoint id=\"section-{index}\" playOrder=\"{order}\"><navLabel><text>{title}</text></navLabel><content src=\"chapter_{cid}.xhtml\"/>\n'
+TOC_SECTION_TAIL = '</navPoint>\n'
+TOC_TAIL = '</navMap>\n</ncx>'
+
+# EPUB 3 navigation document
+NAV_HEAD = '<?xml version=\"1.0\" encoding=\"utf-8\"?>\n' + \
+    '<!DOCTYPE html>\n' + \
+    '<html xmlns=\"http://www.w3.org/1999/xhtml\" xmlns:epub=\"http://www.idpf.org/2007/ops\" xml:lang=\"zh-CN\">\n' + \
+    '<head>\n' + \
+    '    <title>目录</title>\n' + \
+    '    <link href=\"stylesheet.css\" type=\"text/css\" rel=\"stylesheet\"/>\n' + \
+    '</head>\n' + \
+    '<body>\n' + \
+    '<nav epub:type=\"toc\" id=\"toc\">\n' + \
+    '    <h1>目录</h1>\n' + \
+    '    <ol>\n'
+# format with cid, title
+NAV_ITEM = '        <li><a href=\"chapter_{cid}.xhtml\">{title}</a></li>\n'
+# a section and its chapters, format with cid, title
+NAV_SECTION_HEAD = '        <li><a href=\"chapter_{cid}.xhtml\">{title}</a><ol>\n'
+NAV_SECTION_TAIL = '        </ol></li>\n'
+NAV_TAIL = '    </ol>\n</nav>\n</body>\n</html>'
+
+# format with title, authors, version (2.0, or 3.0 with nav.xhtml)
+OPF_HEAD = '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n' + \
+    '<package xmlns=\"http://www.idpf.org/2007/opf\" xmlns:dc=\"http://purl.org/dc/elements/1.1/\" unique-identifier=\"bookid\" version=\"{version}\">\n' + \
+    '<metadata xmlns:dc=\"http://purl.org/dc/elements/1.1/\" xmlns:opf=\"http://www.idpf.org/2007/opf\">\n' + \
+    '    <dc:title>{title}</dc:title>\n' + \
+    '    <dc:creator>{authors}</dc:creator>\n' + \
+    '    <dc:description>{title}</dc:description>\n' + \
+    '    <dc:language>zh-cn</dc:language>\n' + \
+    '    <dc:date>2020-05-14T12:42:30+08:00</dc:date>\n' + \
+    '    <dc:contributor>Roger Lee</dc:contributor>\n' + \
+    '    <dc:publisher>epubook</dc:publisher>\n' + \
+    '    <dc:identifier id=\"bookid\">epubook:000000</dc:identifier>\n'
+OPF_COVER_META = '    <meta name=\"cover\" content=\"cover-image\"/>\n'
+# required by EPUB 3, format with modified, such as 2020-05-14T04:42:30Z
+OPF_MODIFIED = '    <meta property=\"dcterms:modified\">{modified}</meta>\n'
+OPF_MANIFEST = '</metadata>\n' + \
+    '\n' + \
+    '<manifest>\n'
+# format with href, id
+OPF_ITEM = '    <item href=\"{href}\" id=\"{id}\" media-type=\"application/xhtml+xml\"/>\n'
+OPF_NAV = '    <item href=\"nav.xhtml\" id=\"nav\" media-type=\"application/xhtml+xml\" properties=\"nav\"/>\n'
+# format with id, href, media_type
+OPF_RESOURCE = '    <item id="{id}" href="{href}" media-type="{media_type}"/>\n'
+OPF_SPINE = '    <item href=\"catalog.xhtml\" id=\"catalog\" media-type=\"application/xhtml+xml\"/>\n' + \
+    '    <item href=\"stylesheet.css\" id=\"css\" media-type=\"text/css\"/>\n' + \
+    '    <item href=\"page.xhtml\" id=\"page\" media-type=\"application/xhtml+xml\"/>\n' + \
+    '    <item href=\"toc.ncx\" media-type=\"application/x-dtbncx+xml\" id=\"ncx\"/>\n' + \
+    '</manifest>\n' + \
+    '\n' + \
+    '<spine toc=\"ncx\">\n' + \
+    '    <itemref idref=\"page\"/>\n' + \
+    '    <itemref idref=\"catalog\"/>\n'
+# format with id
+OPF_ITEMREF = '    <itemref idref=\"{id}\"/>\n'
+OPF_TAIL = '</spine>\n' + \
+    '<guide>\n' + \
+    '    <reference href=\"catalog.xhtml\" type=\"toc\" title=\"目录\"/>\n' + \
+    '</guide>\n' + \
+    '</package>\n'
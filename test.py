@@ -1,9 +1,11 @@
 import os, re
-import requests
 from epub import Epub
+from fetch import Fetcher
+from cache import HttpCache
+from normalize import Normalizer
 
 def get_catalog(url):
-    response = requests.get(url, headers=headers)
+    response = fetcher.get(url)
     response.encoding = response.apparent_encoding
     text = response.text.replace(' class=\"empty\"', '')
     catalog_regx = '<dd><a href=\"/(.*?)\"  >(.*?)</a></dd>'
@@ -13,7 +15,7 @@ def get_catalog(url):
 
     image_regx = '<div id=\"fmimg\"><img alt=\"(.*?)\" src=\"(.*?)\" width='
     image_src = re.findall(image_regx, text, re.DOTALL)[0][1]
-    img = requests.get(image_src)
+    img = fetcher.get(image_src)
     with open('cover.jpg', 'wb') as f:
         f.write(img.content)
         f.flush()
@@ -28,18 +30,17 @@ def get_catalog(url):
     return urls, title, intro[0]
 
 def get_chapter(url):
-    response = requests.get(url, headers=headers)
+    return parse_chapter(fetcher.get(url))
+
+def parse_chapter(response):
     # print(response.apparent_encoding)
     # print('utf-8' in response.text)
     # response.encoding = response.apparent_encoding
     response.encoding = 'gbk'
     regx = '<div id=\"content\">(.*?)</div>'
     content = re.findall(regx, response.text, re.DOTALL)
-    content = content[0].replace('&nbsp;', '').split('<br>')
-    while '' in content:
-        content.remove('')
-
-    return content
+    # empty lines and &nbsp; are removed by the normalizer of the epub
+    return content[0].split('<br>')
 
 def create_epub(url_list, title_list):
     epub = Epub('世子bu凶')
@@ -47,11 +48,12 @@ def create_epub(url_list, title_list):
     epub.add_author('关关bu公子')
     epub.add_cover('cover.jpg')
     epub.add_intro(intro)
+    epub.set_normalizer(Normalizer(unescape=True))
 
-    for i, url in enumerate(url_list):
-        chaper = get_chapter(url)
-        id = os.path.split(url)[1].split('.')[0]
-        epub.create_chapter(id, title_list[i], chaper, False)
+    # fetch concurrently, chapters are still created in order
+    ids = [os.path.split(url)[1].split('.')[0] for url in url_list]
+    fetcher.create_chapters(epub, zip(ids, title_list, url_list),
+                            parse_chapter)
 
     epub.create()
 
@@ -64,7 +66,13 @@ if __name__ == "__main__":
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.96 Safari/537.36 Edg/88.0.705.50',
     }
 
+    # pages not changed since the last run are not downloaded again
+    cache = HttpCache('.epubook_cache')
+    fetcher = Fetcher(workers=8, rate=5, headers=headers, cache=cache)
     urls, title, intro = get_catalog(book_url)
     # print(intro)
     create_epub(urls[:10], title[:10])
+    fetcher.close()
+    print(cache.stats())
+    cache.close()
     # chapter = get_chapter(urls[20])
@@ -0,0 +1,128 @@
+''' Tests of the fetch pipeline against a local HTTP server.
+
+Run: python -m unittest test_fetch (or pytest), requires requests.
+'''
+import os, time, shutil, tempfile, threading, unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import requests
+    from fetch import Fetcher
+    from cache import HttpCache
+except ImportError:  # requests is optional
+    raise unittest.SkipTest('requests is not installed')
+from epub import Epub
+
+
+class Handler(BaseHTTPRequestHandler):
+    ''' /slow/<n>: replies later for smaller n, so requests finish out of order
+    /flaky: 503 twice, then 200
+    /down: always 503
+    /etag: 304 if If-None-Match matches, otherwise 200 with an ETag
+    '''
+    counts = {}  # {path:number of requests}
+    finished = []  # n of /slow/<n> in the order they are replied
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            count = self.counts[self.path] = self.counts.get(self.path, 0) + 1
+        if self.path.startswith('/slow/'):
+            n = int(self.path.split('/')[-1])
+            time.sleep((8 - n) * 0.03)
+            with self.lock:
+                self.finished.append(n)
+            self.reply(200, f'page {n}')
+        elif self.path == '/flaky':
+            self.reply(503 if count <= 2 else 200, 'flaky')
+        elif self.path == '/down':
+            self.reply(503, 'down')
+        elif self.path == '/etag':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.reply(304)
+            else:
+                self.reply(200, 'cached body', {'ETag': '"v1"'})
+        else:
+            self.reply(404, 'not found')
+
+    def reply(self, status, body='', headers=None):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        if status != 304:
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FetcherTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        cls.base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Handler.counts.clear()
+        Handler.finished.clear()
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_map_keeps_order(self):
+        urls = [f'{self.base}/slow/{n}' for n in range(8)]
+        with Fetcher(workers=8) as fetcher:
+            pages = list(fetcher.map(lambda r: r.text, urls))
+        self.assertEqual(pages, [f'page {n}' for n in range(8)])
+        # the last page is replied first
+        self.assertNotEqual(Handler.finished, sorted(Handler.finished))
+
+    def test_create_chapters_keeps_order(self):
+        epub = Epub(os.path.join(self.dir, 'book'))
+        chapters = [(n, f't{n}', f'{self.base}/slow/{n}') for n in range(8)]
+        with Fetcher(workers=8) as fetcher:
+            fetcher.create_chapters(epub, chapters, lambda r: [r.text])
+        self.assertNotEqual(Handler.finished, sorted(Handler.finished))
+        self.assertEqual(list(epub.catalog.keys()), list(range(8)))
+
+    def test_retry(self):
+        with Fetcher(retries=3, backoff=0) as fetcher:
+            self.assertEqual(fetcher.get(f'{self.base}/flaky').text, 'flaky')
+        self.assertEqual(Handler.counts['/flaky'], 3)
+        with Fetcher(retries=1, backoff=0) as fetcher:
+            with self.assertRaises(requests.HTTPError) as e:
+                fetcher.get(f'{self.base}/down')
+        self.assertEqual(e.exception.response.status_code, 503)
+        self.assertEqual(Handler.counts['/down'], 2)
+
+    def test_conditional_get(self):
+        cache = HttpCache(os.path.join(self.dir, 'cache'))
+        url = f'{self.base}/etag'
+        try:
+            with Fetcher(cache=cache) as fetcher:
+                first = fetcher.get(url)
+                second = fetcher.get(url)
+            self.assertEqual(first.text, 'cached body')
+            self.assertEqual(second.text, 'cached body')
+            self.assertEqual(second.status_code, 200)
+            self.assertEqual(Handler.counts['/etag'], 2)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+        finally:
+            cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,19 +1,86 @@
-import os, shutil
+import os, io, time, json, zipfile, hashlib
+import templates
+
+MEDIA_TYPES = {
+    'xhtml': 'application/xhtml+xml',
+    'html': 'application/xhtml+xml',
+    'css': 'text/css',
+    'ncx': 'application/x-dtbncx+xml',
+    'opf': 'application/oebps-package+xml',
+    'xml': 'application/xml',
+    'json': 'application/json',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'svg': 'image/svg+xml',
+    'ttf': 'font/ttf',
+    'otf': 'font/otf',
+    'woff': 'font/woff',
+    'woff2': 'font/woff2',
+}
+
+# already compressed formats are stored, others are deflated
+COMPRESS_POLICY = {
+    'image/jpeg': zipfile.ZIP_STORED,
+    'image/png': zipfile.ZIP_STORED,
+    'image/gif': zipfile.ZIP_STORED,
+    'image/webp': zipfile.ZIP_STORED,
+    'font/woff': zipfile.ZIP_STORED,
+    'font/woff2': zipfile.ZIP_STORED,
+}
+
+
+# files added by `EpubBase.add_file` are logged in the temp dir, one JSON
+# object a line, so `Epub.resume` can find them without the index file
+SOURCES_LOG = 'sources.jsonl'
+
+
+def media_type(name: str) -> str:
+    ''' media type of a file by its suffix '''
+    suffix = os.path.splitext(name)[1][1:].lower()
+    return MEDIA_TYPES.get(suffix, 'application/octet-stream')
+
+
+def file_sha1(filename: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
 
 
 class EpubBase():
 
-    def __init__(self, path: str) -> None:
+    def __init__(self, path: str, stream: bool = False) -> None:
         self.title = os.path.split(path)[1].split('.')[0]
         self.author = []
         self.lang = 'zh-cn'
         self.intro = 'No introduction'
         self.cover_img_path = None
+        self.resources = {}  # {sha1:(href, id, media type)}
+        self.sources = {}  # {path inside the book:source file}, not copied
+        self.font_href = None  # the embedded font, see Epub.set_font
+        self.font_family = None
+        self.draft = False
+        self.compress_policy = dict(COMPRESS_POLICY)
 
         self.path = path
+        self.meta_path = os.path.join(self.path, 'META-INF')
+        self.stream = stream
+        self.zip = None
+        if stream:
+            # write entries straight into the epub, mimetype must be the
+            # first entry and stored
+            self.zip = zipfile.ZipFile(self.path + '.epub', 'w',
+                                       zipfile.ZIP_DEFLATED)
+            self.zip.writestr('mimetype',
+                              templates.MIMETYPE,
+                              compress_type=zipfile.ZIP_STORED)
+            return
         if not os.path.exists(self.path):
             os.mkdir(self.path)
-        self.meta_path = os.path.join(self.path, 'META-INF')
         if not os.path.exists(self.meta_path):
             os.mkdir(self.meta_path)
         # self.ops_path = os.path.join(self.path, 'OPS')
@@ -35,184 +102,197 @@ class EpubBase():
 
     def add_cover(self, img_name: str) -> None:
         if not os.path.exists(img_name):
-            print(f"Image: {img_name} not exists!")
-            exit(1)
-        self.suffix = img_name.split('.')[1]
-        self.cover_img_path = os.path.join(self.path, f'cover.{self.suffix}')
-        shutil.copy(img_name, self.cover_img_path)
-        if self.suffix == 'jpg':
-            self.media_type = 'jpeg'
-        elif self.suffix == 'svg':
-            self.media_type = 'svg+xml'
-        else:
-            self.media_type = self.suffix
+            raise FileNotFoundError(f'Image: {img_name} not exists!')
+        self.suffix = os.path.splitext(img_name)[1][1:].lower()
+        href = self.add_resource(img_name, f'cover.{self.suffix}', 'cover-image')
+        self.cover_img_path = os.path.join(self.path, href)
+        self.media_type = media_type(href).split('/')[-1]
 
-    def write_META_INF(self) -> None:
-        content = '<?xml version=\"1.0\"?>\n' + \
-            '<container version=\"1.0\" xmlns=\"urn:oasis:names:tc:opendocument:xmlns:container\">\n' + \
-            '   <rootfiles>\n' + \
-            '      <rootfile full-path=\"content.opf\" media-type=\"application/oebps-package+xml\"/>\n' + \
-            '   </rootfiles>\n' + \
-            '</container>'
-
-        with open(os.path.join(self.meta_path, 'container.xml'),
-                  'w',
+    def add_image(self, img_name: str) -> str:
+        ''' add an image used in chapters, such as <img src="href"/>,
+        the same image is stored only once however many times it's added
+
+        Args:
+            img_name: image file path
+
+        Returns:
+            href of the image in the book
+        '''
+        if not os.path.exists(img_name):
+            raise FileNotFoundError(f'Image: {img_name} not exists!')
+        return self.add_resource(img_name)
+
+    def add_resource(self, filename: str, name: str = None, rid: str = None) -> str:
+        ''' add a file into the book and its manifest, files with the same
+        content (sha1) are stored only once. A resource with the same `name`
+        or `rid` but other content, such as an older cover, is replaced
+
+        Args:
+            filename: source file path
+            name: path inside the book, default is images/`sha1`.`suffix`
+            rid: id in manifest, default is res-`sha1`
+
+        Returns:
+            href of the file in the book
+        '''
+        sha1 = file_sha1(filename)
+        if sha1 in self.resources:
+            href, _, mtype = self.resources[sha1]
+            if rid is not None:
+                self.remove_resources(None, rid, sha1)
+                self.resources[sha1] = (href, rid, mtype)
+                self.log_source(href, hash=sha1, id=rid, media_type=mtype)
+            return href
+        suffix = os.path.splitext(filename)[1].lower()
+        name = name or f'images/{sha1[:16]}{suffix}'
+        rid = rid or f'res-{sha1[:16]}'
+        self.remove_resources(name, rid, sha1)
+        self.add_file(filename, name)
+        self.resources[sha1] = (name, rid, media_type(name))
+        self.log_source(name, hash=sha1, id=rid, media_type=media_type(name))
+        return name
+
+    def remove_resources(self, name: str, rid: str, keep: str) -> None:
+        ''' remove resources named `name` or with id `rid` except the one of
+        sha1 `keep`, their removal is logged in SOURCES_LOG
+        '''
+        old = [
+            sha1 for sha1, (href, _rid, _) in self.resources.items()
+            if sha1 != keep and (href == name or _rid == rid)
+        ]
+        if old and self.stream:
+            raise ValueError(
+                f'{name or rid} is written already, it can\'t be replaced '
+                'in stream mode')
+        for sha1 in old:
+            href = self.resources.pop(sha1)[0]
+            self.sources.pop(href, None)
+            if href != name:
+                # a line of `name` follows and replaces it anyway
+                self.log_source(href)
+
+    def restore_resource(self, sha1: str, href: str, rid: str,
+                         mtype: str) -> None:
+        ''' add a resource of the last build back, such as the cover '''
+        for old in [
+                h for h, (_href, _rid, _) in self.resources.items()
+                if h != sha1 and (_href == href or _rid == rid)
+        ]:
+            del self.resources[old]
+        self.resources[sha1] = (href, rid, mtype)
+        if rid == 'cover-image':
+            self.cover_img_path = os.path.join(self.path, href)
+            self.suffix = os.path.splitext(href)[1][1:]
+            self.media_type = mtype.split('/')[-1]
+
+    def compress_type(self, name: str) -> int:
+        ''' zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED for a file of the book '''
+        if self.draft:
+            return zipfile.ZIP_STORED
+        return self.compress_policy.get(media_type(name), zipfile.ZIP_DEFLATED)
+
+    def authors(self) -> str:
+        return ", ".join(self.author) if self.author != [] else 'Unknow'
+
+    def open_file(self, name: str, mode: str = 'w') -> io.IOBase:
+        ''' open a file of the book for writing
+
+        Args:
+            name: path inside the book, such as 'META-INF/container.xml'
+            mode: 'w' for text (utf-8), 'wb' for bytes
+        '''
+        if self.stream:
+            f = self.zip.open(name, 'w')
+            return f if mode == 'wb' else io.TextIOWrapper(f, encoding='utf-8')
+        if mode == 'wb':
+            return open(os.path.join(self.path, name), 'wb')
+        return open(os.path.join(self.path, name), 'w', encoding='utf-8')
+
+    def file_size(self, name: str) -> int:
+        ''' size of a written file of the book '''
+        if self.stream:
+            return self.zip.getinfo(name).file_size
+        return os.path.getsize(os.path.join(self.path, name))
+
+    def add_file(self, filename: str, name: str) -> None:
+        ''' add an existing file into the book. It's not copied into the temp
+        dir, only checked by a stat call, and read straight into the epub
+        file when it's created. In stream mode, it's written at once.
+
+        Args:
+            filename: source file path
+            name: path inside the book
+        '''
+        if self.stream:
+            self.zip.write(filename, name, self.compress_type(name))
+            return
+        if not os.path.isfile(filename):
+            raise FileNotFoundError(f'File: {filename} not exists!')
+        self.sources[name] = os.path.abspath(filename)
+
+    def log_source(self, name: str, **info) -> None:
+        ''' append the source of a file of the book into SOURCES_LOG, the
+        last line of a name wins, a null path means it's not from a source
+        file any more
+
+        Args:
+            name: path inside the book
+            info: such as title of a chapter, hash of a resource
+        '''
+        if self.stream:
+            return
+        line = json.dumps({'name': name, 'path': self.sources.get(name), **info},
+                          ensure_ascii=False)
+        # a single short write in append mode, lines of threads don't mix
+        with open(os.path.join(self.path, SOURCES_LOG), 'a',
                   encoding='utf-8') as f:
-            f.write(content)
+            f.write(line + '\n')
+
+    def write_META_INF(self) -> None:
+        with self.open_file('META-INF/container.xml') as f:
+            f.write(templates.CONTAINER)
 
     def write_mimetype(self) -> None:
-        content = 'application/epub+zip'
-        with open(os.path.join(self.path, 'mimetype'), 'w',
-                  encoding='utf-8') as f:
-            f.write(content)
+        if self.stream:
+            # already written as the first entry of the zip
+            return
+        with self.open_file('mimetype') as f:
+            f.write(templates.MIMETYPE)
 
     def write_stylesheet(self) -> None:
-        content = 'body{\n' + \
-            '    margin:10px;\n' + \
-            '    font-size: 1.0em;\n' + \
-            '}\n' + \
-            'ul,li{list-style-type:none;margin:0;padding:0;}\n' + \
-            '\n' + \
-            'p{text-indent:2em; line-height:1.5em; margin-top:0; margin-bottom:1.5em;}\n' + \
-            '\n' + \
-            '.catalog{line-height:2.5em;font-size: 0.8em;}\n' + \
-            'li{border-bottom: 1px solid #D5D5D5;}\n' + \
-            'h1{font-size:1.6em; font-weight:bold;}\n' + \
-            '\n' + \
-            'h2 {\n' + \
-            '    display: block;\n' + \
-            '    font-size: 1.2em;\n' + \
-            '    font-weight: bold;\n' + \
-            '    margin-bottom: 0.83em;\n' + \
-            '    margin-left: 0;\n' + \
-            '    margin-right: 0;\n' + \
-            '    margin-top: 1em;\n' + \
-            '}\n' + \
-            '\n' + \
-            '.mbppagebreak {\n' + \
-            '    display: block;\n' + \
-            '    margin-bottom: 0;\n' + \
-            '    margin-left: 0;\n' + \
-            '    margin-right: 0;\n' + \
-            '    margin-top: 0 }\n' + \
-            'a {\n' + \
-            '    color: inherit;\n' + \
-            '    text-decoration: none;\n' + \
-            '    cursor: default\n' + \
-            '    }\n' + \
-            'a[href] {\n' + \
-            '    color: blue;\n' + \
-            '    text-decoration: none;\n' + \
-            '    cursor: pointer\n' + \
-            '    }\n' + \
-            '\n' + \
-            '.italic {\n' + \
-            '    font-style: italic\n' + \
-            '    }'
-        with open(os.path.join(self.path, 'stylesheet.css'),
-                  'w',
-                  encoding='utf-8') as f:
-            f.write(content)
+        with self.open_file('stylesheet.css') as f:
+            f.write(templates.STYLESHEET)
+            if self.font_href is not None:
+                f.write(
+                    templates.FONT_FACE.format(family=self.font_family,
+                                               href=self.font_href))
 
     def write_page(self) -> None:
-        authors = ", ".join(self.author) if self.author != [] else 'Unknow'
-        content = '<?xml version=\"1.0\" encoding=\"utf-8\" standalone=\"no\"?>\n' + \
-            '<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.1//EN\" \"http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd\">\n' + \
-            '<html xmlns=\"http://www.w3.org/1999/xhtml\" xml:lang=\"zh-CN\">\n' + \
-            '    <head>\n' + \
-            '        <meta http-equiv=\"Content-Type\" content=\"text/html; charset=UTF-8\"/>\n' + \
-            '        <title>书籍信息</title>\n' + \
-            '        <style type=\"text/css\" title=\"override_css\">\n' + \
-            '            @page {padding: 0pt; margin:0pt}\n' + \
-            '            body { text-align: left; padding:0pt; margin: 0pt;font-size: 1.0em}\n' + \
-            '            ul,li{list-style-type:none;margin:0;padding:0;line-height: 1.5em;font-size: 1.0em}\n' + \
-            '            h1{font-size:1.5em}\n' + \
-            '            h2 {font-size: 1.2em}\n' + \
-            '		.copyright{color:#646464}\n' + \
-            '        </style>\n' + \
-            '    </head>\n' + \
-            '    <body>\n' + \
-            '        <div>\n' + \
-            f'            <h1>{self.title}</h1>\n' + \
-            f'            <h2>作者：{authors}</h2>\n' + \
-            '        <ul><li><b>内容简介：</b></li>\n' + \
-            f'            <li>{self.intro}</li>\n' + \
-            '            <li><br/></li>\n' + \
-            '            <li class=\"copyright\">Epub is created by <b>epubook</b></li>\n' + \
-            '            <li class=\"copyright\">github: [<b><a href=\"https://github.com/JintaoLee-Roger/epubook\" target=\"_blank\">JintaoLee-Roger/crawler</a></b>]</li>\n' + \
-            '        </ul>\n' + \
-            '        </div>\n' + \
-            '    </body>\n' + \
-            '</html>'
-        with open(os.path.join(self.path, 'page.xhtml'), 'w',
-                  encoding='utf-8') as f:
-            f.write(content)
-
-    def write_toc_head(self) -> None:
-        authors = ", ".join(self.author) if self.author != [] else 'Unknow'
-        content = '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n' + \
-            '<ncx xmlns=\"http://www.daisy.org/z3986/2005/ncx/\" version=\"2005-1\">\n' + \
-            '<head>\n' + \
-            '    <meta content=\"epubook:000000\" name=\"dtb:uid\"/>\n' + \
-            '    <meta content=\"2\" name=\"dtb:depth\"/>\n' + \
-            '    <meta content=\"epubook [https://github.com/JintaoLee-Roger/crawler]\" name=\"dtb:generator\"/>\n' + \
-            '    <meta content=\"0\" name=\"dtb:totalPageCount\"/>\n' + \
-            '    <meta content=\"0\" name=\"dtb:maxPageNumber\"/>\n' + \
-            '</head>\n' + \
-            '<docTitle>\n' + \
-            f'    <text>{self.title}</text>\n' + \
-            '</docTitle>\n' + \
-            '<docAuthor>\n' + \
-            f'    <text>{authors}</text>\n' + \
-            '</docAuthor>\n' + \
-            '<navMap>\n'
-        with open(os.path.join(self.path, 'toc.ncx'), 'w',
-                  encoding='utf-8') as f:
-            f.write(content)
-
-    def write_catalog_head(self) -> None:
-        content = '<?xml version=\"1.0\" encoding=\"utf-8\" standalone=\"no\"?>\n' + \
-            '<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.1//EN\" \"http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd\">\n' + \
-            '<html xmlns=\"http://www.w3.org/1999/xhtml\" xml:lang=\"zh-CN\">\n' + \
-            '<head>\n' + \
-            '    <title>目录</title>\n' + \
-            '    <link href=\"stylesheet.css\" type=\"text/css\" rel=\"stylesheet\"/>\n' + \
-            '    <style type=\"text/css\">\n' + \
-            '        @page { margin-bottom: 5.000000pt; margin-top: 5.000000pt; }\n' + \
-            '    </style>\n' + \
-            '</head>\n' + \
-            '<body>\n' + \
-            '    <h1>目录<br/>Content</h1>\n' + \
-            '    <ul>\n'
-        with open(os.path.join(self.path, 'catalog.xhtml'),
-                  'w',
-                  encoding='utf-8') as f:
-            f.write(content)
-
-    def write_opf_head(self) -> None:
-        authors = ", ".join(self.author) if self.author != [] else 'Unknow'
-        content = '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n' + \
-            '<package xmlns=\"http://www.idpf.org/2007/opf\" xmlns:dc=\"http://purl.org/dc/elements/1.1/\" unique-identifier=\"bookid\" version=\"2.0\">\n' + \
-            '<metadata xmlns:dc=\"http://purl.org/dc/elements/1.1/\" xmlns:opf=\"http://www.idpf.org/2007/opf\">\n' + \
-            f'    <dc:title>{self.title}</dc:title>\n' + \
-            f'    <dc:creator>{authors}</dc:creator>\n' + \
-            f'    <dc:description>{self.title}</dc:description>\n' + \
-            '    <dc:language>zh-cn</dc:language>\n' + \
-            '    <dc:date>2020-05-14T12:42:30+08:00</dc:date>\n' + \
-            '    <dc:contributor>Roger Lee</dc:contributor>\n' + \
-            '    <dc:publisher>epubook</dc:publisher>\n' + \
-            '    <dc:identifier id=\"bookid\">epubook:000000</dc:identifier>\n'
+        with self.open_file('page.xhtml') as f:
+            f.write(
+                templates.PAGE.format(title=self.title,
+                                      authors=self.authors(),
+                                      intro=self.intro))
 
-        if self.cover_img_path is not None:
-            content = content + '    <meta name=\"cover\" content=\"cover-image\"/>\n'
-        content = content + '</metadata>\n' + \
-            '\n' + \
-            '<manifest>\n'
+    def write_toc_head(self, f: io.TextIOBase, depth: int = 1) -> None:
+        f.write(templates.TOC_HEAD.format(title=self.title,
+                                          authors=self.authors(),
+                                          depth=depth))
 
-        with open(os.path.join(self.path, 'content.opf'),
-                  'w',
-                  encoding='utf-8') as f:
-            f.write(content)
+    def write_catalog_head(self, f: io.TextIOBase) -> None:
+        f.write(templates.CATALOG_HEAD)
+
+    def write_opf_head(self, f: io.TextIOBase, version: str = '2.0') -> None:
+        f.write(templates.OPF_HEAD.format(title=self.title,
+                                          authors=self.authors(),
+                                          version=version))
+        if self.cover_img_path is not None:
+            f.write(templates.OPF_COVER_META)
+        if version != '2.0':
+            f.write(
+                templates.OPF_MODIFIED.format(modified=time.strftime(
+                    '%Y-%m-%dT%H:%M:%SZ', time.gmtime())))
+        f.write(templates.OPF_MANIFEST)
 
 
 if __name__ == "__main__":